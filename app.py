@@ -1,61 +1,110 @@
 import os
+import hashlib
 
-from flask import Flask, render_template, request, flash, redirect, session, g, url_for, send_file, Response, jsonify
-from flask_debugtoolbar import DebugToolbarExtension
-from models import connect_db, db, User, Contact, ContactStat, Stage, Task, Transaction, TransType, MailOptions, Property
+import click
+from flask import Flask, Blueprint, render_template, request, flash, redirect, session, g, url_for, send_file, Response, jsonify, abort, make_response
+from flask.cli import with_appcontext
+from models import connect_db, db, User, Contact, UserContact, ContactStat, Stage, Task, Transaction, TransType, MailOptions, Property, UserFile, record_contact_changes, user_owns_contact, contact_fingerprint, phone_key
 from sqlalchemy.exc import IntegrityError
 from forms import RegisterForm, LoginForm, FeedbackForm, ChangePassword, EmailForm, UploadFileForm, ContactForm, UserForm
-from io import BytesIO, StringIO
 from sqlalchemy import or_, desc, asc
 from helper import get_contact_image
+from search import search_contacts
+from pagination import paginate_contacts, InvalidCursor, InvalidLimit
+from files import send_blob, get_variant, VARIANTS
+from usercache import user_cache, get_current_user, UserGone
 from whitenoise import WhiteNoise
 
-import requests
-from typeform import extract_typeform_answers, extract_database
-from os.path import splitext
-from helper import random_image_selector
-
-import csv
+import typeform  # registers the typeform job handlers
+from jobs import enqueue
+from dedupe import DEDUPE_POLICY, find_duplicates, merge_values
+from passwords import PasswordBusy
+from metrics import init_metrics, query_budget
 
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
-app.wsgi_app = WhiteNoise(app.wsgi_app, root='static/')
+PASSWORD_BUSY = "Too many people are signing in right now. Please try again in a moment"
+
+views = Blueprint('views', __name__)
+
+
+def create_app(config=None):
+    """ make the app: configuration, extensions and the views. config overrides the settings below.
+
+    Making the app doesn't touch the database. New databases get their tables from `flask create-db` (or
+    migrate.py, which also upgrades existing ones).
+    """
+
+    app = Flask(__name__)
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root='static/')
+
+    # Get DB_URI from environ variable (useful for production/testing) or,
+    # if not set there, use development local db.
+    app.config['SQLALCHEMY_DATABASE_URI'] = (
+        os.environ.get('DATABASE_URL', 'postgres:///jane'))
+
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ECHO'] = False
+    app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+    # add a Server-Timing header (time spent in SQL and in all) to every response
+    app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING') == '1'
+    app.config.update(config or {})
+
+    ## the toolbar is only for development (FLASK_ENV=development turns debug on), it is slow to load
+    if app.debug:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    ## before the views, so the time to load the logged in user counts too
+    init_metrics(app)
 
+    app.register_blueprint(views)
+    app.cli.add_command(create_db)
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgres:///jane'))
+    connect_db(app)
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+    return app
 
-toolbar = DebugToolbarExtension(app)
 
-connect_db(app)
+@click.command('create-db')
+@with_appcontext
+def create_db():
+    """Create the database tables that don't exist yet."""
 
-db.create_all()
+    db.create_all()
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@views.before_app_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
+
+    g.user comes from the per-process user cache and only loads the full User when a route needs more than the
+    basic fields (see usercache.py).
+    """
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = get_current_user(session[CURR_USER_KEY])
 
     else:
         g.user = None
 
 
+@views.app_errorhandler(UserGone)
+def user_gone(error):
+    """The logged in user was deleted in the middle of their session, log them out."""
+
+    do_logout()
+    flash("Access unauthorized.", "danger")
+
+    return redirect("/login")
+
+
 def do_login(user):
     """Log in user."""
 
@@ -69,14 +118,16 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/')
+@views.route('/')
+@query_budget(0)
 def home():
     """redirect to login for now"""
 
     return redirect('/login')
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@views.route('/signup', methods=["GET", "POST"])
+@query_budget(2)
 def signup():
     """Handle user signup.
 
@@ -90,7 +141,7 @@ def signup():
 
     if g.user:
         # if g.user.has_paid:
-        return redirect (url_for('contacts', user_id=g.user.id))
+        return redirect (url_for('views.contacts', user_id=g.user.id))
         # else:
         #     return redirect('/payment')
     
@@ -106,7 +157,11 @@ def signup():
         first_name = form.first_name.data.lower()
         last_name = form.last_name.data.lower()
 
-        user = User.register(email, pwd, first_name, last_name)
+        try:
+            user = User.register(email, pwd, first_name, last_name)
+        except PasswordBusy:
+            flash(PASSWORD_BUSY, 'danger')
+            return render_template('accounts/register.html', form=form), 503
         db.session.add(user)
 
         try:
@@ -124,21 +179,27 @@ def signup():
 
         return render_template('accounts/register.html', form=form)
 
-@app.route('/login', methods=["GET", "POST"])
+@views.route('/login', methods=["GET", "POST"])
+## looking the user up, and when the password is hashed again (see User.authenticate) saving it and reloading the user
+@query_budget(3)
 def login():
     """Handle user login."""
     if g.user:
-        return redirect(url_for('contacts', user_id=g.user.id))
+        return redirect(url_for('views.contacts', user_id=g.user.id))
 
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(form.email.data,
-                                 form.password.data)
+        try:
+            user = User.authenticate(form.email.data,
+                                     form.password.data)
+        except PasswordBusy:
+            flash(PASSWORD_BUSY, 'danger')
+            return render_template('accounts/login.html', form=form), 503
 
         if user:
             do_login(user)
-            redirect_url = url_for('home_page', user_id=user.id)
+            redirect_url = url_for('views.home_page', user_id=user.id)
             flash(f"Hello, {user.first_name}!", "success")
             return redirect(redirect_url)
 
@@ -147,7 +208,8 @@ def login():
     return render_template('accounts/login.html', form=form)
 
 
-@app.route('/logout')
+@views.route('/logout')
+@query_budget(1)
 def logout():
     """Handle logout of user."""
 
@@ -157,7 +219,8 @@ def logout():
     return redirect("/login")
 
 
-@app.route('/onboard')
+@views.route('/onboard')
+@query_budget(1)
 def onboard():
     """renders a page with typeform embedded to gather initial user information"""
 
@@ -166,22 +229,26 @@ def onboard():
 
 #############  receiving data from typeform webhook##########################
 
-@app.route('/webhooks', methods=['POST'])
+@views.route('/webhooks', methods=['POST'])
+@query_budget(3)
 def typeform_responses():
-    """ route for typeform to send the data of each registered user. """
+    """ route for typeform to send the data of each registered user.
 
-    answers = request.json['form_response']['answers']
+    The file downloads and the contact import take a while, so the response is only stored here and handled by
+    the background worker (see jobs.py).
+    """
 
-    # get answers from typeform and fill user info in database
-    extract_typeform_answers(answers)
+    ## typeform repeats deliveries, the key makes sure each response is only processed once
+    job = enqueue('typeform', request.json, key=typeform.delivery_key(request.json))
 
-    # return status 200 so that the webhook shows it works.
-    return Response(status=200)
+    # return status 202 so that the webhook shows it works.
+    return jsonify(job=job.id), 202
 
 
 ########################### Profile Routes#############################################
 
-@app.route('/users/<int:user_id>')
+@views.route('/users/<int:user_id>')
+@query_budget(1)
 def home_page(user_id):
     """ route for determined home page for user. for not it redirects to contacts"""
 
@@ -193,10 +260,11 @@ def home_page(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/login")
 
-    return redirect(url_for('contacts', user_id=user_id))
+    return redirect(url_for('views.contacts', user_id=user_id))
 
 
-@app.route('/users/<int:user_id>/settings',methods=["GET", "POST"])
+@views.route('/users/<int:user_id>/settings',methods=["GET", "POST"])
+@query_budget(4)
 def user_settings(user_id):
     """ route for displaying user settings"""
 
@@ -218,19 +286,51 @@ def user_settings(user_id):
         form.populate_obj(user)
         db.session.add(user)
         db.session.commit()
-        return redirect( url_for('user_settings', user_id=user_id))
+        user_cache.invalidate(user.id)
+        return redirect( url_for('views.user_settings', user_id=user_id))
 
     return render_template('/home/settings.html', current_user=g.user, form=form)
 
-@app.route('/payment')
+@views.route('/payment')
+@query_budget(1)
 def payment():
     """route for displaying user payment page"""
 
     return render_template('/home/payment.html')
 
+@views.route('/users/<int:user_id>/files/<kind>')
+@query_budget(3)
+def user_file(user_id, kind):
+    """ route for streaming one of the files a user uploaded during onboarding.
+
+    Image files can be asked for as a variant (?variant=thumb, webp or thumb.webp, see files.py).
+    """
+
+    # only the user (or an admin) can see the user's files
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/login")
+    if g.user.id != user_id and not g.user.is_admin:
+        abort(403)
+
+    file = UserFile.query.filter_by(user_id=user_id, kind=kind).first_or_404()
+    immutable = request.args.get('v') == file.content_hash
+
+    variant = request.args.get('variant')
+    if variant:
+        if variant not in VARIANTS or not file.content_type.startswith('image/'):
+            abort(404)
+        blob = get_variant(file, variant)
+        if not blob:
+            abort(404)
+        return send_blob(blob, immutable)
+
+    return send_blob(file, immutable)
+
 ########################### Contact Routes#############################################
 
-@app.route('/users/<int:user_id>/contacts', methods=["GET", "POST"])
+@views.route('/users/<int:user_id>/contacts', methods=["GET", "POST"])
+@query_budget(8)
 def contacts(user_id):
     """ route for seeing and manipulate user's content user's contacts.  """
 
@@ -248,8 +348,22 @@ def contacts(user_id):
     ## what follows happens when the form is submitted
     if form.validate_on_submit():
 
-        user= User.query.get(user_id)
+        ## adjust certain data types in form to enum
+        string_to_enum(form)
 
+        ## don't add a second copy of a contact the user already has (see dedupe.py)
+        if DEDUPE_POLICY != 'keep':
+            fingerprint = contact_fingerprint(form.primary_first_name.data, form.primary_last_name.data,
+                                              form.primary_email.data, form.primary_phone.data)
+            duplicate = find_duplicates(user_id, [fingerprint]).get(fingerprint)
+            if duplicate:
+                if DEDUPE_POLICY == 'merge' and merge_values(duplicate, form.data):
+                    record_contact_changes([duplicate])
+                    db.session.commit()
+                    flash(f"{duplicate.primary_first_name} {duplicate.primary_last_name} is already a contact, the new details were added.", "info")
+                else:
+                    flash(f"{duplicate.primary_first_name} {duplicate.primary_last_name} is already a contact.", "info")
+                return redirect(url_for('views.contact_details', contact_id=duplicate.id))
 
         contact = Contact()
 
@@ -258,20 +372,21 @@ def contacts(user_id):
         url= get_contact_image(name)
         contact.image_url= url
 
-        ## adjust certain data types in form to enum
-        string_to_enum(form)
-        
         form.populate_obj(contact)
-        user.contacts.append(contact)
         db.session.add(contact)
+        ## link the contact by id, appending to user.contacts would load all the user's contacts first
+        db.session.flush()
+        db.session.add(UserContact(user_id=user_id, contact_id=contact.id))
+        record_contact_changes([contact])
         db.session.commit()
-        return redirect (url_for('contacts', user_id=user_id))
+        return redirect (url_for('views.contacts', user_id=user_id))
 
     return render_template('/home/contacts.html', current_user=g.user, form=form)
 
 
 
-@app.route('/contacts/<int:contact_id>')
+@views.route('/contacts/<int:contact_id>')
+@query_budget(4)
 def contact_details(contact_id):
     """ route for showing the details of the contact"""
 
@@ -283,17 +398,27 @@ def contact_details(contact_id):
         flash("Access unauthorized.", "danger")
         return redirect("/login")
 
-
-    ## if contact isn't the current user's contact, then go home. 
-    contact = Contact.query.get_or_404(contact_id)
-    if contact not in g.user.contacts:
+    ## if contact isn't the current user's contact, then go home. Checked before the ETag, which only says whether
+    ## the user's contacts changed
+    if not user_owns_contact(g.user.id, contact_id):
+        Contact.query.get_or_404(contact_id)
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    return render_template('/home/contact_details.html', current_user=g.user, contact=contact)
+    ## the page only changes with the contact or the user's name. Pages with flashed messages are never reused.
+    etag = None
+    if '_flashes' not in session:
+        etag = contacts_etag(g.user.id, contact_id, g.user.first_name)
+        if etag_matches(etag):
+            return not_modified(etag)
+
+    contact = Contact.query.get_or_404(contact_id)
+
+    return with_etag(make_response(render_template('/home/contact_details.html', current_user=g.user, contact=contact)), etag)
 
 
-@app.route('/contacts/<int:contact_id>/edit', methods=["GET", "POST"])
+@views.route('/contacts/<int:contact_id>/edit', methods=["GET", "POST"])
+@query_budget(8)
 def contact_edit(contact_id):
     """ route for editing the contact"""
 
@@ -308,7 +433,7 @@ def contact_edit(contact_id):
 
     ## if contact isn't the current user's contact, then go home. 
     contact = Contact.query.get_or_404(contact_id)
-    if contact not in g.user.contacts:
+    if not user_owns_contact(g.user.id, contact_id):
         flash("Access unauthorized.", "danger")
         return redirect("/login")
 
@@ -324,6 +449,7 @@ def contact_edit(contact_id):
         
         form.populate_obj(contact)
         db.session.add(contact)
+        record_contact_changes([contact])
         db.session.commit()
         return redirect(f'/contacts/{contact_id}')
 
@@ -331,7 +457,8 @@ def contact_edit(contact_id):
     ## Note: Check for error on client side. Check for error on server side. 
     return render_template('/home/contact_edit.html', current_user=g.user, contact=contact, form=form)
 
-@app.route('/contacts/<int:contact_id>/delete', methods=["POST"])
+@views.route('/contacts/<int:contact_id>/delete', methods=["POST"])
+@query_budget(8)
 def delete_contact(contact_id):
     """Delete a contact."""
 
@@ -345,29 +472,32 @@ def delete_contact(contact_id):
 
     ## if contact isn't the current user's contact, then go home. 
     contact = Contact.query.get_or_404(contact_id)
-    if contact not in g.user.contacts:
+    if not user_owns_contact(g.user.id, contact_id):
         flash("Access unauthorized.", "danger")
         return redirect("/login")
 
     contact.is_visible = False;
 
     db.session.add(contact)
+    record_contact_changes([contact])
     db.session.commit()
 
-    redirect_url = url_for('contacts', user_id=g.user.id)
+    redirect_url = url_for('views.contacts', user_id=g.user.id)
 
     return redirect(redirect_url)
 
 
 ########################### Transaction Routes#############################################
 
-@app.route('/users/<int:user_id>/transactions')
+@views.route('/users/<int:user_id>/transactions')
+@query_budget(1)
 def transactions(user_id):
 
     return render_template('/home/transactions.html', current_user=g.user)
 
 
-@app.route('/users/<int:user_id>/transactions/<int:trans_id>')
+@views.route('/users/<int:user_id>/transactions/<int:trans_id>')
+@query_budget(1)
 def trans_details(user_id, trans_id):
 
     return render_template('/home/trans_details.html', current_user=g.user)
@@ -386,6 +516,45 @@ def string_to_enum(form):
             form.status.data = status
 
 
+def contacts_etag(user_id, *parts):
+    """ strong ETag for a response built from a user's contacts, or None if there is no such user.
+
+    It only reads the user's contact_seq, which changes with every change to one of the user's contacts (see
+    record_contact_changes), so an unchanged response can be answered with a 304 before anything else is loaded.
+    parts are whatever else the response depends on, like the query string.
+    """
+    seq = db.session.query(User.contact_seq).filter_by(id=user_id).scalar()
+    if seq is None:
+        return None
+
+    key = '|'.join(str(part) for part in (user_id, seq) + parts)
+
+    return hashlib.sha1(key.encode('utf8')).hexdigest()
+
+
+def etag_matches(etag):
+    """ does the client already have the version of the response with this ETag?"""
+
+    return bool(etag) and request.if_none_match.contains(etag)
+
+
+def not_modified(etag):
+    """ empty 304 response telling the client to reuse its copy"""
+
+    return with_etag(Response(status=304), etag)
+
+
+def with_etag(response, etag):
+    """ add the ETag to a response and make the browser check it before reusing its copy"""
+
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+    return response
+
+
 
 
 #################################################
@@ -393,42 +562,120 @@ def string_to_enum(form):
 #################################################
 
 
-@app.route('/api/contacts')
+@views.route('/api/contacts')
+@query_budget(5)
 def list_contacts():
-    """Returns JSON w/ all requested contacts"""
+    """Returns JSON w/ all requested contacts
+
+    Pass a limit to get the contacts one page at a time, in (last name, id) order. The response then has a
+    next_cursor, which is passed back as cursor to get the next page. It is null on the last page. Pages of a search
+    keep that order too, so searches that should come back best matches first leave out the limit (as the contacts
+    page does).
+    """
     search = request.args.get("search")
     contact_id = request.args.get("contact_id")
+    limit = request.args.get("limit", type=int)
+    cursor = request.args.get("cursor")
+
+    etag = contacts_etag(contact_id, request.query_string)
+    if etag_matches(etag):
+        return not_modified(etag)
 
     user=User.query.get_or_404(contact_id)
 
+    ## scope the query to the user's contacts in the database rather than filtering in python
+    contacts = (Contact.query
+                .join(UserContact, UserContact.contact_id == Contact.id)
+                .filter(UserContact.user_id == user.id)
+                .filter(Contact.is_visible.is_(True)))
 
+    ## paging through the list: searching only filters, the page keeps its own order
+    if limit is not None:
+        if search:
+            contacts = search_contacts(contacts, search, ranked=False)
+        try:
+            page, next_cursor = paginate_contacts(Contact.select_serialized(contacts), limit, cursor)
+        except (InvalidCursor, InvalidLimit):
+            abort(400)
 
-    ## search conditions for the Contact models. These will allow database lookup for each listed element. 
-
-    p_f_name = Contact.primary_first_name.ilike(f'%{search}%')
-    p_l_name= Contact.primary_last_name.ilike(f'%{search}%')
-    s_f_name = Contact.secondary_first_name.ilike(f'%{search}%')
-    s_l_name= Contact.secondary_last_name.ilike(f'%{search}%')
-    p_email = Contact.primary_email.ilike(f'%{search}%')
-    s_email= Contact.secondary_email.ilike(f'%{search}%')
-    p_phone = Contact.primary_phone.ilike(f'%{search}%')
-    s_phone= Contact.secondary_phone.ilike(f'%{search}%')
-    notes = Contact.notes.ilike(f'%{search}%')
-    address = Contact.address.ilike(f'%{search}%')
-    suite = Contact.suite.ilike(f'%{search}%')
-    city = Contact.city.ilike(f'%{search}%')
-    state = Contact.state.ilike(f'%{search}%')
-    zip_code = Contact.notes.ilike(f'%{search}%')
-    is_visible = Contact.is_visible.is_(True)
-    # in_user_contacts = Contact.in_(user.contacts)
-    conditions = [p_f_name, p_l_name, s_f_name, s_l_name, p_email, s_email, p_phone, s_phone, notes, address, suite, city, state, zip_code]
- 
+        return with_etag(jsonify(contacts=Contact.serialize_rows(page), next_cursor=next_cursor), etag)
 
+    ## searching goes through the contact search index (see search.py), which also ranks the results
     if search: 
-        contacts= Contact.query.filter(or_ (*conditions)).filter(is_visible).order_by(asc('primary_last_name'))
-        all_contacts = [contact.serialize() for contact in contacts if contact in user.contacts]
+        contacts = search_contacts(contacts, search)
     else:
-        contacts= Contact.query.filter(is_visible).order_by(asc('primary_last_name'))
-        all_contacts = [contact.serialize() for contact in contacts if contact in user.contacts]
+        contacts = contacts.order_by(asc('primary_last_name'))
+
+    ## serialize straight from the selected columns, with the tags of all contacts loaded in one query
+    all_contacts = Contact.serialize_rows(Contact.select_serialized(contacts))
+
+    return with_etag(jsonify(contacts=all_contacts), etag)
+
+
+@views.route('/api/contacts/changes')
+@query_budget(5)
+def list_contact_changes():
+    """Returns JSON w/ the contacts that changed since a given change number
+
+    Pass since=<seq> from a previous response to get only what changed after it. Leave it out to get everything.
+    Changed contacts come back in contacts, deleted ones only as ids in deleted, and seq is the number to pass next time.
+    Only the logged in user's own changes can be asked for, contact_id (the user's id) may be left out.
+    """
+    if not g.user:
+        abort(401)
+
+    contact_id = request.args.get("contact_id", type=int)
+    if contact_id is not None and contact_id != g.user.id:
+        abort(403)
+
+    since = request.args.get("since", -1, type=int)
+
+    etag = contacts_etag(g.user.id, since)
+    if etag_matches(etag):
+        return not_modified(etag)
+
+    user=User.query.get_or_404(g.user.id)
+
+    changes = (Contact.query
+               .join(UserContact, UserContact.contact_id == Contact.id)
+               .filter(UserContact.user_id == user.id)
+               .filter(UserContact.change_seq > since)
+               .order_by(asc(UserContact.change_seq), asc(Contact.id)))
+
+    rows = Contact.select_serialized(changes).all()
+
+    contacts = Contact.serialize_rows([row for row in rows if row.is_visible])
+    deleted = [row.id for row in rows if not row.is_visible]
+
+    return with_etag(jsonify(contacts=contacts, deleted=deleted, seq=user.contact_seq), etag)
+
+
+@views.route('/api/lookup')
+@query_budget(3)
+def lookup_phone():
+    """Returns JSON w/ the logged in user's contacts that have a phone number, for caller ID
+
+    The number can be in any format. It is turned into E.164 and looked up by equality on the indexed phone keys
+    of the contacts (see phone_key), never by searching.
+    """
+    if not g.user:
+        abort(401)
+
+    phone = phone_key(request.args.get("phone"))
+    if not phone:
+        abort(400)
+
+    ## ownership as an EXISTS, so the phone key indexes pick the rows instead of walking all the user's links
+    owned = (UserContact.query
+             .filter(UserContact.contact_id == Contact.id, UserContact.user_id == g.user.id)
+             .exists())
+    contacts = (Contact.query
+                .filter(or_(Contact.primary_phone_key == phone, Contact.secondary_phone_key == phone))
+                .filter(Contact.is_visible.is_(True))
+                .filter(owned)
+                .order_by(asc(Contact.id)))
+
+    return jsonify(phone=phone, contacts=Contact.serialize_rows(Contact.select_serialized(contacts)))
+
 
-    return jsonify(contacts=all_contacts)
+app = create_app()
@@ -0,0 +1,77 @@
+"""How login and typeform user lookups scale with the number of users.
+
+    BENCH_DATABASE_URL=postgresql:///jane-bench python bench_login.py [sizes...]
+
+Fills a scratch database (its tables are dropped and made again, so never point this at real data; the default is
+a sqlite file in the temp directory) with 1k, 10k, 100k and 1M users, and after each size times looking users up
+by email, as User.authenticate does, and by name, as extract_typeform_answers does. Password checking isn't
+timed, bcrypt costs the same whatever the number of users.
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'jane-bench.db'))
+
+from app import app  # connects the database
+from models import db, User, normalize_email
+
+SIZES = [1000, 10000, 100000, 1000000]
+
+LOOKUPS = 1000
+
+BATCH_SIZE = 10000
+
+
+def add_users(start, stop):
+    """ users start to stop-1, added a batch at a time. They share one password hash, hashing isn't what's timed"""
+
+    password = User.register('bench@test.com', 'password', 'bench', 'user').password
+
+    for batch in range(start, stop, BATCH_SIZE):
+        db.session.execute(User.__table__.insert(), [
+            {'email': f"User{n}@Bench.test".lower(), 'password': password, 'first_name': f"first{n}",
+             'last_name': f"last{n}", 'contact_seq': 0}
+            for n in range(batch, min(batch + BATCH_SIZE, stop))])
+        db.session.commit()
+
+
+def time_lookups(lookup, users):
+    """ median seconds of a lookup of a random one of the users"""
+
+    times = []
+    for n in random.sample(range(users), min(LOOKUPS, users)):
+        start = time.perf_counter()
+        found = lookup(n)
+        times.append(time.perf_counter() - start)
+        assert found is not None
+        db.session.expunge_all()
+
+    return statistics.median(times)
+
+
+def by_email(n):
+    return User.query.filter_by(email=normalize_email(f"USER{n}@bench.test")).first()
+
+
+def by_name(n):
+    return User.query.filter_by(first_name=f"first{n}").filter_by(last_name=f"last{n}").first()
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+
+    db.drop_all()
+    db.create_all()
+
+    print(f"{'users':>10} {'email lookup':>14} {'name lookup':>14}")
+    users = 0
+    for size in sizes:
+        add_users(users, size)
+        users = size
+        print(f"{users:>10} {time_lookups(by_email, users) * 1e6:>11.0f} us {time_lookups(by_name, users) * 1e6:>11.0f} us")
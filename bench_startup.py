@@ -0,0 +1,45 @@
+"""How long the app takes to start.
+
+    python bench_startup.py [runs]
+
+Each run is a new python process that imports the app and then serves its first request (the login page, which
+doesn't need the database) with the test client. Prints the median and the slowest time of each.
+"""
+
+import statistics
+import subprocess
+import sys
+
+RUNS = 10
+
+MEASURE = """
+import time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+resp = app.test_client().get('/login')
+served = time.perf_counter()
+assert resp.status_code == 200, resp.status
+print(imported - start, served - imported)
+"""
+
+
+def measure():
+    """ (seconds to import the app, seconds to serve the first request) in a new process"""
+
+    out = subprocess.run([sys.executable, '-c', MEASURE], check=True, capture_output=True, text=True).stdout
+    imported, served = out.split()
+
+    return float(imported), float(served)
+
+
+def report(name, times):
+    print(f"{name:<15} median {statistics.median(times) * 1000:7.1f} ms   slowest {max(times) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    results = [measure() for _ in range(runs)]
+
+    report('import app', [imported for (imported, served) in results])
+    report('first request', [served for (imported, served) in results])
@@ -0,0 +1,196 @@
+"""Benchmarks of the hot paths, on made up data (see fake_data.py).
+
+    BENCH_DATABASE_URL=postgresql:///jane-bench python benchmarks.py [--sizes 1000 10000 ...] [--out results.json]
+    python benchmarks.py --compare before.json after.json
+
+fills a scratch database (its tables are dropped and made again, so never point this at real data; the default is
+a sqlite file in the temp directory) with 1k, 10k and 100k contacts, or the --sizes given (up to 1M), and after
+each size times:
+
+    list_contacts               GET /api/contacts, all of a user's contacts
+    list_contacts_page          the same, 50 at a time
+    list_contacts_search        searching a user's contacts
+    list_contacts_search_page   searching, 50 at a time
+    contact_serialize           Contact.serialize of 100 contacts
+    extract_database            importing an uploaded xlsx of IMPORT_ROWS contacts
+    authenticate                User.authenticate (mostly bcrypt, see BCRYPT_ROUNDS)
+    user_owns_contact           the ownership check of the contact routes
+
+Every user has fake_data.CONTACTS_PER_USER contacts, so the user-level numbers should stay flat as the database
+grows. The results are written as json to --out, with the commit they were measured at, and --compare prints how
+the medians of two such files differ.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+os.environ['DATABASE_URL'] = os.environ.get(
+    'BENCH_DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'jane-bench.db'))
+
+from app import app  # connects the database
+from models import db, User, Contact, UserContact, user_owns_contact
+from fake_data import add_fake_data, fake_workbook, FAKE_PASSWORD
+from typeform import extract_database
+
+SIZES = [1000, 10000, 100000]
+
+# rows in the file extract_database imports
+IMPORT_ROWS = 1000
+
+# times each benchmark runs, fast ones and slow ones
+RUNS = 100
+SLOW_RUNS = 5
+
+SEARCH = 'garcia'
+
+# a median this much bigger than before is reported as slower by --compare
+REGRESSION_RATIO = 1.2
+
+
+def measure(name, size, function, runs=RUNS, setup=None, teardown=None):
+    """ time function() runs times (after calling setup(), untimed, before each run, and teardown() with the same
+    arguments after it) and return the summary"""
+
+    times = []
+    for _ in range(runs):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+        db.session.rollback()
+        if teardown:
+            teardown(*args)
+
+    times.sort()
+    result = {'benchmark': name, 'contacts': size, 'runs': runs,
+              'median_ms': round(statistics.median(times) * 1000, 3),
+              'p95_ms': round(times[int(0.95 * (runs - 1))] * 1000, 3),
+              'min_ms': round(times[0] * 1000, 3)}
+    print(f"{name:<28} {size:>9} {result['median_ms']:>10.2f} ms {result['p95_ms']:>10.2f} ms")
+
+    return result
+
+
+def run_benchmarks(size):
+    """ the benchmarks, with size contacts in the database"""
+
+    client = app.test_client()
+    user = User.query.filter_by(email='user0@example.com').one()
+    user_id = user.id
+    max_contact_id = db.session.query(db.func.max(Contact.id)).scalar()
+    rng = random.Random(size)
+    xlsx = fake_workbook(IMPORT_ROWS, seed=size)
+
+    def get(url):
+        resp = client.get(url)
+        assert resp.status_code == 200, resp.status
+
+    def load_contacts():
+        db.session.expunge_all()
+        contacts = (Contact.query.join(UserContact, UserContact.contact_id == Contact.id)
+                    .filter(UserContact.user_id == user_id).order_by(Contact.id).limit(100).all())
+        return (contacts,)
+
+    def new_user():
+        db.session.rollback()
+        importer = User(email=f"import{rng.randrange(10 ** 9)}@example.com", password='x', first_name='import',
+                        last_name='fake')
+        db.session.add(importer)
+        db.session.commit()
+        return (importer,)
+
+    def import_file(importer):
+        with redirect_stdout(StringIO()):
+            extract_database(importer, xlsx)
+
+    def remove_importer(importer):
+        ## the import commits, the benchmarks after it and the next sizes would see its contacts
+        imported = db.session.query(UserContact.contact_id).filter(UserContact.user_id == importer.id)
+        Contact.query.filter(Contact.id.in_(imported.subquery())).delete(synchronize_session=False)
+        UserContact.query.filter_by(user_id=importer.id).delete()
+        User.query.filter_by(id=importer.id).delete()
+        db.session.commit()
+
+    return [
+        measure('list_contacts', size, lambda: get(f"/api/contacts?contact_id={user_id}"), SLOW_RUNS * 4),
+        measure('list_contacts_page', size, lambda: get(f"/api/contacts?contact_id={user_id}&limit=50")),
+        measure('list_contacts_search', size,
+                lambda: get(f"/api/contacts?contact_id={user_id}&search={SEARCH}"), SLOW_RUNS * 4),
+        measure('list_contacts_search_page', size,
+                lambda: get(f"/api/contacts?contact_id={user_id}&search={SEARCH}&limit=50")),
+        measure('contact_serialize', size, lambda contacts: [contact.serialize() for contact in contacts], RUNS,
+                load_contacts),
+        measure('extract_database', size, import_file, SLOW_RUNS, new_user, remove_importer),
+        measure('authenticate', size, lambda: User.authenticate('user0@example.com', FAKE_PASSWORD), SLOW_RUNS),
+        measure('user_owns_contact', size, lambda: user_owns_contact(user_id, rng.randrange(1, max_contact_id + 1)),
+                RUNS * 10),
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    """ print the medians of two result files side by side"""
+
+    with open(before_path) as file:
+        before = {(result['benchmark'], result['contacts']): result for result in json.load(file)['results']}
+    with open(after_path) as file:
+        after = json.load(file)['results']
+
+    print(f"{'benchmark':<28} {'contacts':>9} {'before':>12} {'after':>12} {'ratio':>7}")
+    for result in after:
+        old = before.get((result['benchmark'], result['contacts']))
+        if not old:
+            continue
+        ratio = result['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+        flag = '  slower' if ratio > REGRESSION_RATIO else ''
+        print(f"{result['benchmark']:<28} {result['contacts']:>9} {old['median_ms']:>9.2f} ms "
+              f"{result['median_ms']:>9.2f} ms {ratio:>7.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the hot paths, on made up data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="numbers of contacts to measure at")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench-results.json', help="where to write the results")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    db.drop_all()
+    db.create_all()
+
+    print(f"{'benchmark':<28} {'contacts':>9} {'median':>13} {'p95':>13}")
+    results = []
+    contacts = 0
+    for size in sorted(args.sizes):
+        add_fake_data(contacts, size, seed=args.seed)
+        contacts = size
+        results.extend(run_benchmarks(size))
+
+    with open(args.out, 'w') as file:
+        json.dump({'commit': git_commit(), 'database': db.engine.dialect.name, 'python': platform.python_version(),
+                   'seed': args.seed, 'results': results}, file, indent=2)
+    print(f"results written to {args.out}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Finding and merging duplicate contacts.
+
+    python dedupe.py
+
+merges the duplicate contacts already in the database.
+
+Two contacts of a user are duplicates when they have the same fingerprint: the same primary name, email and phone
+once case, spacing and phone formatting are ignored (see contact_fingerprint in models.py). What happens to a new
+contact that duplicates an existing one depends on the policy:
+
+    skip   the new contact is dropped
+    merge  empty fields of the existing contact are filled in from the new one
+    keep   the new contact is added anyway
+"""
+
+import os
+
+from sqlalchemy import func
+from models import db, Contact, UserContact, ContactTag, Transaction, record_contact_changes
+from jobs import job_handler
+
+DEDUPE_POLICIES = ['skip', 'merge', 'keep']
+
+DEDUPE_POLICY = os.environ.get('CONTACT_DEDUPE_POLICY', 'merge')
+
+# fields a merge fills in when the existing contact doesn't have them
+MERGE_FIELDS = ['secondary_first_name', 'secondary_last_name', 'primary_email', 'secondary_email', 'primary_phone',
+                'secondary_phone', 'primary_DOB', 'secondary_DOB', 'notes', 'address', 'suite', 'city', 'state',
+                'zip_code']
+
+# most fingerprints looked up in one query
+LOOKUP_CHUNK_SIZE = 1000
+
+
+def find_duplicates(user_id, fingerprints):
+    """ returns a dict of fingerprint: the user's visible contact with that fingerprint (the oldest one, if there
+    are several), for the fingerprints that match any"""
+
+    fingerprints = list(set(fingerprints))
+    found = {}
+
+    for start in range(0, len(fingerprints), LOOKUP_CHUNK_SIZE):
+        contacts = (Contact.query
+                    .join(UserContact, UserContact.contact_id == Contact.id)
+                    .filter(UserContact.user_id == user_id, Contact.is_visible.is_(True),
+                            Contact.fingerprint.in_(fingerprints[start:start + LOOKUP_CHUNK_SIZE]))
+                    .order_by(Contact.id.desc()))
+        for contact in contacts:
+            found[contact.fingerprint] = contact
+
+    return found
+
+
+def merge_values(contact, values):
+    """ fill in the empty MERGE_FIELDS of a contact (a Contact or a dict of column values) from a dict of values.
+    Returns True if anything changed"""
+
+    changed = False
+
+    for field in MERGE_FIELDS:
+        value = values.get(field)
+        if value is None or value == '':
+            continue
+
+        if isinstance(contact, dict):
+            if contact.get(field) in (None, ''):
+                contact[field] = value
+                changed = True
+        elif getattr(contact, field) in (None, ''):
+            setattr(contact, field, value)
+            changed = True
+
+    return changed
+
+
+def merge_duplicates(user_id=None):
+    """ merge the duplicate contacts already saved, for one user or for everyone. Returns the number of contacts
+    merged away.
+
+    The oldest contact of each set of duplicates is kept. It gets the fields, tags and transactions of the others,
+    which are then hidden the way deleted contacts are. Contacts shared with another user are left alone.
+    """
+
+    shared = (db.session.query(UserContact.contact_id)
+              .group_by(UserContact.contact_id)
+              .having(func.count(UserContact.user_id) > 1))
+
+    groups = (db.session.query(UserContact.user_id, Contact.fingerprint)
+              .join(Contact, Contact.id == UserContact.contact_id)
+              .filter(Contact.is_visible.is_(True), Contact.fingerprint.isnot(None), ~Contact.id.in_(shared))
+              .group_by(UserContact.user_id, Contact.fingerprint)
+              .having(func.count(Contact.id) > 1))
+    if user_id is not None:
+        groups = groups.filter(UserContact.user_id == user_id)
+
+    fingerprints_by_user = {}
+    for group_user_id, fingerprint in groups:
+        fingerprints_by_user.setdefault(group_user_id, []).append(fingerprint)
+
+    merged = 0
+
+    for group_user_id, fingerprints in fingerprints_by_user.items():
+        contacts = (Contact.query
+                    .join(UserContact, UserContact.contact_id == Contact.id)
+                    .filter(UserContact.user_id == group_user_id, Contact.is_visible.is_(True),
+                            Contact.fingerprint.in_(fingerprints), ~Contact.id.in_(shared))
+                    .order_by(Contact.id)
+                    .all())
+
+        keepers = {}
+        changed = []
+        for contact in contacts:
+            keeper = keepers.setdefault(contact.fingerprint, contact)
+            if keeper is contact:
+                continue
+
+            merge_values(keeper, {field: getattr(contact, field) for field in MERGE_FIELDS})
+            merge_tags(keeper, contact)
+            Transaction.query.filter_by(contact_id=contact.id).update({Transaction.contact_id: keeper.id},
+                                                                     synchronize_session=False)
+            contact.is_visible = False
+            changed.extend([keeper, contact])
+            merged += 1
+
+        record_contact_changes(changed)
+        db.session.commit()
+
+    return merged
+
+
+def merge_tags(keeper, contact):
+    """ give the keeper the tags of a duplicate it doesn't already have"""
+
+    tag_ids = {tag_id for (tag_id,) in db.session.query(ContactTag.tag_id).filter_by(contact_id=keeper.id)}
+
+    for (tag_id,) in db.session.query(ContactTag.tag_id).filter_by(contact_id=contact.id):
+        if tag_id not in tag_ids:
+            db.session.add(ContactTag(contact_id=keeper.id, tag_id=tag_id))
+            tag_ids.add(tag_id)
+
+
+@job_handler('merge_duplicates')
+def merge_duplicates_job(job):
+    """ job merging the saved duplicates of a user (payload user_id) or of everyone (no user_id)"""
+
+    merged = merge_duplicates(job.payload.get('user_id'))
+    print(f"merged {merged} duplicate contacts")
+
+
+if __name__ == '__main__':
+    from app import app  # connects the database
+
+    print(f"merged {merge_duplicates()} duplicate contacts")
@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+import requests
+from requests.adapters import HTTPAdapter
+
+##############################################################################
+# Downloading uploaded files
+#
+# A typeform submission links to up to nine files. They are fetched at the same time on a few threads sharing one
+# pooled session, so the whole download takes about as long as the slowest file. Each response is streamed into
+# a temp file that only goes to disk once it gets big, and a file that is too big or too slow is given up on.
+
+# most files fetched at the same time
+MAX_DOWNLOADS = 4
+
+# largest file accepted, in bytes
+MAX_DOWNLOAD_SIZE = 25 * 1024 * 1024
+
+# seconds to connect, and to wait for each read from the server
+DOWNLOAD_TIMEOUT = (5, 30)
+
+# seconds one whole download may take
+DOWNLOAD_DEADLINE = 120
+
+# files are kept in memory up to this size, then moved to disk
+SPOOL_SIZE = 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=MAX_DOWNLOADS, pool_maxsize=MAX_DOWNLOADS))
+session.mount('http://', HTTPAdapter(pool_connections=MAX_DOWNLOADS, pool_maxsize=MAX_DOWNLOADS))
+
+
+class DownloadError(Exception):
+    """ raised when a file can't be downloaded"""
+
+
+def download(url, max_size=MAX_DOWNLOAD_SIZE):
+    """ fetch a url into a temp file, returned rewound to the start. The caller closes it"""
+
+    started = time.monotonic()
+    file = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+    try:
+        with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+
+            ## refuse early when the server says up front that the file is too big
+            if int(response.headers.get('Content-Length') or 0) > max_size:
+                raise DownloadError(f"{url} is larger than {max_size} bytes")
+
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise DownloadError(f"{url} is larger than {max_size} bytes")
+                if time.monotonic() - started > DOWNLOAD_DEADLINE:
+                    raise DownloadError(f"{url} took longer than {DOWNLOAD_DEADLINE} seconds")
+                file.write(chunk)
+    except requests.RequestException as error:
+        file.close()
+        raise DownloadError(f"{url} couldn't be downloaded: {error}") from error
+    except BaseException:
+        file.close()
+        raise
+
+    file.seek(0)
+
+    return file
+
+
+def download_all(urls):
+    """ fetch a dict of name: url at the same time, returns a dict of name: temp file.
+
+    If any download fails, the files already fetched are closed and the error of the first one that failed is
+    raised, DownloadError unless something other than the download went wrong.
+    """
+
+    if not urls:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOADS, len(urls))) as pool:
+        futures = {name: pool.submit(download, url) for (name, url) in urls.items()}
+
+    files = {}
+    error = None
+    for name, future in futures.items():
+        try:
+            files[name] = future.result()
+        except BaseException as download_error:
+            error = error or download_error
+
+    if error:
+        for file in files.values():
+            file.close()
+        raise error
+
+    return files
@@ -0,0 +1,225 @@
+"""Made up users and contacts, for the benchmarks (see benchmarks.py).
+
+Everything comes from a seeded random.Random, so the same seed always makes the same data. Each CONTACTS_PER_USER
+contacts belong to a user of their own (user0@example.com, user1@example.com, ..., all with FAKE_PASSWORD), with tags,
+and a transaction with its stages and tasks for some of them.
+"""
+
+import random
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from models import db, User, Tag, ContactTag, Transaction, Stage, Task, TransType, TransStatus, ContactStat, MailOptions
+
+CONTACTS_PER_USER = 1000
+
+FAKE_PASSWORD = 'password'
+
+# share of contacts with a spouse or partner, notes, a birthday and a transaction
+SECONDARY_SHARE = 0.3
+NOTES_SHARE = 0.2
+DOB_SHARE = 0.5
+TRANSACTION_SHARE = 0.1
+
+STAGES_PER_TRANSACTION = 3
+TASKS_PER_STAGE = 2
+
+# contacts written at a time
+BATCH_SIZE = 1000
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Karen',
+               'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Betty', 'Mark', 'Sandra', 'Wei', 'Ashley', 'Steven',
+               'Kimberly', 'Andrew', 'Emily', 'Jose', 'Donna', 'Kevin', 'Michelle', 'Brian', 'Carol', 'Hiroshi',
+               'Amanda', 'Priya', 'Melissa', 'Ahmed', 'Deborah', 'Luis', 'Stephanie', 'Omar', 'Rebecca']
+
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+              'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores', 'Green',
+              'Adams', 'Nelson', 'Baker', 'Hall', 'Rivera', 'Campbell', 'Mitchell', 'Carter', 'Roberts', 'Chen',
+              'Patel', 'Kim', 'Okafor', 'Novak', 'Rossi', 'Schmidt', 'Cohen', 'Murphy', "O'Brien"]
+
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.com', 'outlook.com', 'icloud.com', 'comcast.net', 'hotmail.com']
+
+STREETS = ['Main St', 'Oak Ave', 'Pine St', 'Maple Dr', 'Cedar Ln', 'Elm St', 'Lake View Rd', 'Hillside Ave',
+           'Park Pl', '2nd Ave', 'Washington Blvd', 'Sunset Blvd', 'Mackubin St', 'Broadway', 'Meadow Ct']
+
+# city, state, area code, first three digits of the zip code
+CITIES = [('Seattle', 'WA', '206', '981'), ('Tacoma', 'WA', '253', '984'), ('Portland', 'OR', '503', '972'),
+          ('San Francisco', 'CA', '415', '941'), ('Oakland', 'CA', '510', '946'), ('Los Angeles', 'CA', '213', '900'),
+          ('Austin', 'TX', '512', '787'), ('Chicago', 'IL', '312', '606'), ('Saint Paul', 'MN', '651', '551'),
+          ('Boston', 'MA', '617', '021'), ('Denver', 'CO', '303', '802'), ('Atlanta', 'GA', '404', '303')]
+
+NOTES = ['Prefers texts to calls', 'Looking for a 3 bedroom near good schools', 'Met at the open house',
+         'Referred by a past client', 'Wants to downsize next spring', 'Pre-approved, ready to move']
+
+TAGS = ['buyer', 'seller', 'investor', 'first home', 'relocating', 'referral', 'open house', 'vip', 'renter',
+        'sphere']
+
+TASKS = ['Call the lender', 'Order the inspection', 'Send the disclosures', 'Schedule the appraisal',
+         'Confirm the closing date', 'Book the photographer']
+
+
+def fake_phone(rng, area_code):
+    return f"({area_code}) {rng.randrange(200, 1000)}-{rng.randrange(10000):04d}"
+
+
+def fake_contact(rng):
+    """ a dict of contact fields, shaped like a row of an uploaded spreadsheet"""
+
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    city, state, area_code, zip_prefix = rng.choice(CITIES)
+
+    contact = {
+        'primary_first_name': first_name,
+        'primary_last_name': last_name,
+        'primary_email': f"{first_name}.{last_name}{rng.randrange(10000)}@{rng.choice(EMAIL_DOMAINS)}"
+                         .lower().replace("'", ''),
+        'primary_phone': fake_phone(rng, area_code),
+        'address': f"{rng.randrange(1, 10000)} {rng.choice(STREETS)}",
+        'city': city,
+        'state': state,
+        'zip_code': f"{zip_prefix}{rng.randrange(100):02d}",
+    }
+
+    if rng.random() < SECONDARY_SHARE:
+        contact['secondary_first_name'] = rng.choice(FIRST_NAMES)
+        contact['secondary_last_name'] = last_name
+        contact['secondary_phone'] = fake_phone(rng, area_code)
+    if rng.random() < NOTES_SHARE:
+        contact['notes'] = rng.choice(NOTES)
+    if rng.random() < DOB_SHARE:
+        contact['primary_DOB'] = datetime(1940, 1, 1) + timedelta(days=rng.randrange(60 * 365))
+
+    return contact
+
+
+def fake_contacts(count, seed=0):
+    """ count made up contacts (see fake_contact)"""
+
+    rng = random.Random(seed)
+
+    return [fake_contact(rng) for _ in range(count)]
+
+
+def fake_workbook(count, seed=0):
+    """ an xlsx file of count made up contacts, as a user would upload it"""
+
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    columns = ['primary_first_name', 'primary_last_name', 'primary_email', 'primary_phone', 'secondary_first_name',
+               'secondary_last_name', 'secondary_phone', 'primary_DOB', 'notes', 'address', 'city', 'state',
+               'zip_code']
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    for _ in range(count):
+        contact = fake_contact(rng)
+        sheet.append([contact.get(column) for column in columns])
+
+    content = BytesIO()
+    workbook.save(content)
+
+    return content.getvalue()
+
+
+def fake_user(number, password):
+    """ the made up user owning contacts number * CONTACTS_PER_USER on, added if it isn't there yet"""
+
+    email = f"user{number}@example.com"
+    user = User.query.filter_by(email=email).first()
+
+    if not user:
+        user = User(email=email, password=password, first_name=f"user{number}", last_name='fake')
+        db.session.add(user)
+        db.session.flush()
+
+    return user
+
+
+def next_id(model):
+    """ the id the next row of a table would get. Transactions, stages and tasks are written with their ids given,
+    so a batch of each can go in with one executemany"""
+
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def add_fake_data(start, stop, seed=0):
+    """ add made up contacts number start to stop - 1, with their users, tags, transactions, stages and tasks"""
+
+    from importer import convert_row, insert_contacts
+
+    rng = random.Random(f"{seed}:{start}")
+    password = User.register('fake@example.com', FAKE_PASSWORD, 'fake', 'fake').password
+
+    tag_ids = {tag.name: tag.id for tag in Tag.query.filter(Tag.name.in_(TAGS))}
+    for name in TAGS:
+        if name not in tag_ids:
+            tag = Tag(name=name)
+            db.session.add(tag)
+            db.session.flush()
+            tag_ids[name] = tag.id
+
+    batch = start
+    while batch < stop:
+        ## a batch never spans two users
+        user_number = batch // CONTACTS_PER_USER
+        batch_stop = min(stop, batch + BATCH_SIZE, (user_number + 1) * CONTACTS_PER_USER)
+        user = fake_user(user_number, password)
+
+        contacts = []
+        for _ in range(batch, batch_stop):
+            values = convert_row(fake_contact(rng), '/static/assets/img/contacts/andy/1.png')
+            values['status'] = rng.choice(list(ContactStat))
+            values['mail_preference'] = rng.choice(list(MailOptions))
+            contacts.append(values)
+        contact_ids = insert_contacts(user.id, contacts)
+
+        contact_tags = [{'contact_id': contact_id, 'tag_id': tag_ids[name]}
+                        for contact_id in contact_ids for name in rng.sample(TAGS, rng.randrange(3))]
+        if contact_tags:
+            db.session.execute(ContactTag.__table__.insert(), contact_tags)
+
+        add_fake_transactions(rng, [contact_id for contact_id in contact_ids if rng.random() < TRANSACTION_SHARE])
+        db.session.commit()
+        batch = batch_stop
+
+
+def add_fake_transactions(rng, contact_ids):
+    """ a transaction for each of the contacts, with its stages and their tasks"""
+
+    if not contact_ids:
+        return
+
+    transactions, stages, tasks = [], [], []
+    transaction_id, stage_id, task_id = next_id(Transaction), next_id(Stage), next_id(Task)
+
+    for contact_id in contact_ids:
+        price = rng.randrange(200, 2000) * 1000
+        closed = rng.random() < 0.5
+        transactions.append({'id': transaction_id, 'name': f"{rng.randrange(1, 10000)} {rng.choice(STREETS)}",
+                             'trans_type': rng.choice(list(TransType)), 'contact_id': contact_id,
+                             'listing_price': price, 'sold_price': price * rng.uniform(0.9, 1.1) if closed else None,
+                             'closing_date': datetime(2020, 1, 1) + timedelta(days=rng.randrange(1000)) if closed else None,
+                             'status': TransStatus.closed if closed else TransStatus.opened})
+
+        for stage_number in range(1, STAGES_PER_TRANSACTION + 1):
+            stages.append({'id': stage_id, 'stage_number': stage_number, 'transaction_id': transaction_id})
+            for name in rng.sample(TASKS, TASKS_PER_STAGE):
+                tasks.append({'id': task_id, 'name': name, 'is_done': closed, 'stage_id': stage_id})
+                task_id += 1
+            stage_id += 1
+        transaction_id += 1
+
+    db.session.execute(Transaction.__table__.insert(), transactions)
+    db.session.execute(Stage.__table__.insert(), stages)
+    db.session.execute(Task.__table__.insert(), tasks)
+
+    ## rows added with their ids given don't move the id sequences on
+    if db.engine.dialect.name == 'postgresql':
+        for table in ['transactions', 'stages', 'tasks']:
+            db.session.execute(db.text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), MAX(id)) FROM {table}"))
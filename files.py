@@ -0,0 +1,138 @@
+import hashlib
+from io import BytesIO
+
+from flask import request, Response, stream_with_context
+from sqlalchemy import event, DDL, func
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import ContentRange
+from models import db, UserFile, UserFileVariant
+
+##############################################################################
+# Serving uploaded files
+#
+# Files are sent in chunks read straight from the database with substr(), so a large file is never held in memory
+# as a whole. Responses support Range requests and carry the content hash as ETag. Image files also have
+# variants (thumbnails, webp copies) which are made on the first request and kept in user_file_variants.
+
+CHUNK_SIZE = 256 * 1024
+
+# one year, for urls that carry the content hash and so change whenever the content does
+MAX_AGE = 365 * 24 * 60 * 60
+
+# variant name: (largest width/height or None to keep the size, format or None to keep the format)
+VARIANTS = {
+    'thumb': (256, None),
+    'webp': (None, 'WEBP'),
+    'thumb.webp': (256, 'WEBP'),
+}
+
+IMAGE_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+
+# postgres compresses large values by default, and then has to decompress all of one to read any part of it.
+# Stored uncompressed, reading a chunk of a file only reads that chunk.
+for model in [UserFile, UserFileVariant]:
+    event.listen(model.__table__, 'after_create',
+                 DDL("ALTER TABLE %(table)s ALTER COLUMN content SET STORAGE EXTERNAL").execute_if(dialect='postgresql'))
+
+
+def read_chunks(model, row_id, start, stop):
+    """ yields the bytes start to stop of the content of a UserFile or UserFileVariant, one chunk at a time"""
+
+    offset = start
+    while offset < stop:
+        length = min(CHUNK_SIZE, stop - offset)
+        chunk = db.session.query(func.substr(model.content, offset + 1, length)).filter(model.id == row_id).scalar()
+        yield bytes(chunk)
+        offset += length
+
+
+def make_variant(content, max_size, image_format):
+    """ returns (content, content type) of a resized and/or converted copy of an image"""
+
+    from PIL import Image
+
+    image = Image.open(BytesIO(content))
+    image_format = image_format or image.format
+
+    if max_size:
+        image.thumbnail((max_size, max_size))
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    output = BytesIO()
+    image.save(output, format=image_format)
+
+    return output.getvalue(), IMAGE_FORMATS.get(image_format, 'application/octet-stream')
+
+
+def get_variant(file, name):
+    """ returns the UserFileVariant of an image file with this name (see VARIANTS), making it the first time.
+    None if the file can't be read as an image"""
+
+    from PIL import UnidentifiedImageError
+
+    variant = UserFileVariant.query.filter_by(file_id=file.id, name=name).first()
+    if variant:
+        return variant
+
+    ## a file can start like an image and still be cut short or corrupt
+    try:
+        content, content_type = make_variant(file.content, *VARIANTS[name])
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    variant = UserFileVariant(file_id=file.id, name=name, content_type=content_type, size=len(content),
+                              content_hash=hashlib.sha256(content).hexdigest())
+    variant.content = content
+    db.session.add(variant)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        ## another request made the same variant at the same time
+        db.session.rollback()
+        variant = UserFileVariant.query.filter_by(file_id=file.id, name=name).one()
+
+    return variant
+
+
+def send_blob(blob, immutable=False):
+    """ response streaming the content of a UserFile or UserFileVariant.
+
+    Answers If-None-Match with a 304 and a single byte range with a 206. Pass immutable=True when the url has
+    the current content hash in it (?v=<content_hash>), the response can then be cached for good.
+    """
+
+    etag = blob.content_hash
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        start, stop, status = 0, blob.size, 200
+
+        ## ranges are only honoured if the client's copy (If-Range) is still current
+        if request.range and len(request.range.ranges) == 1 and request.headers.get('If-Range', etag).strip('"') == etag:
+            byte_range = request.range.range_for_length(blob.size)
+            if byte_range is None:
+                response = Response(status=416)
+                response.content_range = ContentRange('bytes', None, None, blob.size)
+                return response
+            start, stop = byte_range
+            status = 206
+
+        response = Response(stream_with_context(read_chunks(type(blob), blob.id, start, stop)), status=status,
+                            mimetype=blob.content_type, direct_passthrough=True)
+        response.content_length = stop - start
+        if status == 206:
+            response.content_range = ContentRange('bytes', start, stop, blob.size)
+
+    response.set_etag(etag)
+    response.accept_ranges = 'bytes'
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.max_age = MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+
+    return response
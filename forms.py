@@ -4,7 +4,7 @@ from wtforms.validators import InputRequired, Email, EqualTo, Length, Optional,
 from flask_wtf.file import FileField, FileRequired, FileAllowed
 from models import ContactStat, MailOptions
 from wtforms.fields.html5 import DateField, TelField
-import phonenumbers
+from wtforms.fields.core import UnboundField
 
 
 class RegisterForm(FlaskForm):
@@ -44,15 +44,29 @@ class PasswordForm(FlaskForm):
     password = PasswordField('Password', validators=[InputRequired()])
 
 
+PHONE_ERROR = 'Invalid US phone number. Correct it or leave it blank'
+
+
+def format_phone(phone):
+    """ a US phone number in the national format, (206) 555-0100. Raises ValueError if it isn't a valid number"""
+
+    import phonenumbers  # only loaded once a phone number is checked
+
+    try:
+        p = phonenumbers.parse(phone, 'US')
+    except phonenumbers.phonenumberutil.NumberParseException:
+        raise ValueError(phone)
+    if not phonenumbers.is_valid_number(p):
+        raise ValueError(phone)
+
+    return phonenumbers.format_number(p, phonenumbers.PhoneNumberFormat.NATIONAL)
+
+
 def validate_phone(self, phone):
         try:
-            p = phonenumbers.parse(phone.data, 'US')
-            if not phonenumbers.is_valid_number(p):
-                raise ValueError()
-            else: 
-                phone.data=phonenumbers.format_number(p, phonenumbers.PhoneNumberFormat.NATIONAL)
-        except (phonenumbers.phonenumberutil.NumberParseException, ValueError):
-            raise ValidationError('Invalid US phone number. Correct it or leave it blank')
+            phone.data = format_phone(phone.data)
+        except ValueError:
+            raise ValidationError(PHONE_ERROR)
 
 
 class ContactForm(FlaskForm):
@@ -97,6 +111,47 @@ class ContactForm(FlaskForm):
 
 
 
+def field_rules(form_class):
+    """ the checks of a form's fields, so they can be applied outside of WTForms (see validation.py).
+
+    Returns {field name: rule}, rule being a dict with the field class, whether it is required, its max length,
+    whether it must be a phone number, its Email validator if it must be an email, the allowed choices of a select,
+    and the error messages.
+    """
+
+    rules = {}
+
+    for name in dir(form_class):
+        field = getattr(form_class, name)
+        if not isinstance(field, UnboundField):
+            continue
+
+        rule = {'field_class': field.field_class, 'required': False, 'max_length': None, 'email': False,
+                'phone': False, 'choices': None, 'messages': {}}
+        field_validators = field.kwargs.get('validators') or (field.args[1] if len(field.args) > 1 else [])
+
+        for validator in field_validators:
+            if isinstance(validator, InputRequired):
+                rule['required'] = True
+                rule['messages']['required'] = validator.message or 'This field is required.'
+            elif isinstance(validator, Length) and validator.max != -1:
+                rule['max_length'] = validator.max
+                rule['messages']['max_length'] = validator.message or f'Field cannot be longer than {validator.max} characters.'
+            elif isinstance(validator, Email):
+                rule['email'] = validator
+                rule['messages']['email'] = validator.message or 'Invalid email address.'
+            elif validator is validate_phone:
+                rule['phone'] = True
+                rule['messages']['phone'] = PHONE_ERROR
+
+        if 'choices' in field.kwargs:
+            rule['choices'] = [value for (value, label) in field.kwargs['choices']]
+
+        rules[name] = rule
+
+    return rules
+
+
 class UserForm(FlaskForm):
     """ form for user profile information"""
 
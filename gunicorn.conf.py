@@ -0,0 +1,21 @@
+import gc
+
+
+def on_starting(server):
+    """ set up what the workers share, in the master before they are forked: the gender name dictionary (see
+    helper.py), so they share its memory instead of each loading a copy, and the password hash slots"""
+
+    from helper import get_detector
+    from metrics import remove_dead_metrics
+    from passwords import share_slots
+
+    get_detector()
+
+    ## the limit on password hashes is then shared by all the workers (see passwords.py)
+    share_slots()
+
+    ## the metrics files of an earlier run's workers (see metrics.py). A running job worker's file is kept
+    remove_dead_metrics()
+
+    ## keep the garbage collector from touching these objects in the workers, which would copy their pages
+    gc.freeze()
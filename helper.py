@@ -1,8 +1,26 @@
 import random
-import gender_guesser.detector as gender
+from functools import lru_cache
+from threading import Lock
+
+## the gender detector reads a large name dictionary, so it is only made the first time a name is looked up.
+## gunicorn.conf.py makes it in the master process, so the workers share that copy instead of each reading it again.
+detector = None
+detector_lock = Lock()
+
+
+def get_detector():
+    """ the gender detector, made on first use"""
+
+    global detector
+
+    if detector is None:
+        with detector_lock:
+            if detector is None:
+                import gender_guesser.detector as gender
+                detector = gender.Detector(case_sensitive=False)
+
+    return detector
 
-## defind the gender detector once so that you don't have to multiple times for each name
-d = gender.Detector(case_sensitive=False)
 
 ## note: Currently not being used
 def random_image_selector():
@@ -13,10 +31,16 @@ def random_image_selector():
     return '{:02.0f}'.format(num)
 
 
+@lru_cache(maxsize=10000)
+def guess_gender(name):
+    """ gender of a (lower cased) first name, remembered for the names seen most recently"""
+
+    return get_detector().get_gender(name)
+
+
+def image_for_gender(g):
+    """ a random image url for a person of this gender"""
 
-def get_contact_image(name):
-    """ gets gender of a person given the name and returns a random image url for the person"""
-    g= d.get_gender(name)
     if g == "male":
         num=random.randrange(3, 11)
         link= f"/static/assets/img/contacts/male/{num}.png"
@@ -27,4 +51,18 @@ def get_contact_image(name):
         num=random.randrange(1, 3)
         link= f"/static/assets/img/contacts/andy/{num}.png"
 
-    return link
\ No newline at end of file
+    return link
+
+
+def get_contact_image(name):
+    """ gets gender of a person given the name and returns a random image url for the person"""
+
+    return image_for_gender(guess_gender((name or '').strip().lower()))
+
+
+def get_contact_images(names):
+    """ image urls for a list of names, like get_contact_image but each distinct name is only looked up once"""
+
+    genders = {name: guess_gender((name or '').strip().lower()) for name in set(names)}
+
+    return [image_for_gender(genders[name]) for name in names]
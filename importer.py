@@ -0,0 +1,175 @@
+from datetime import datetime
+
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Contact, UserContact, ContactStat, MailOptions, next_contact_seq, record_contact_changes, contact_fingerprint, phone_key
+from dedupe import DEDUPE_POLICY, find_duplicates, merge_values
+from helper import get_contact_images
+from validation import validate_rows, TEXT_FIELDS, DATE_FIELDS, BOOLEAN_FIELDS
+
+##############################################################################
+# Bulk contact import
+#
+# Spreadsheet rows are checked a chunk at a time, with the checks of the contact form (see validation.py). Each
+# chunk is written with one multi-row insert into contacts (returning the new ids on postgres) and one into
+# users_contacts, then committed. A bad row is reported and skipped, it doesn't stop the rest of the import.
+
+IMPORT_CHUNK_SIZE = 1000
+
+
+class ImportResult:
+    """What came of an import: how many contacts were imported, how many rows were merged into or skipped as
+    duplicates of existing contacts, and the errors for rows that weren't imported.
+
+    errors is a list of (row number, message), rows numbered from 1 like the rows of the file (after the header).
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.merged = 0
+        self.skipped = 0
+        self.errors = []
+
+    def __repr__(self):
+        return (f"<ImportResult imported={self.imported} merged={self.merged} skipped={self.skipped} "
+                f"errors={len(self.errors)}>")
+
+
+def convert_row(data, image_url):
+    """ turn a checked row (see validation.validate_rows) into the column values of a new contact"""
+
+    # every row has all the columns, so a chunk can go in one multi-row insert
+    values = {field: data.get(field) for field in TEXT_FIELDS + DATE_FIELDS}
+    values.update({field: bool(data.get(field)) for field in BOOLEAN_FIELDS})
+    values['mail_preference'] = data.get('mail_preference') or MailOptions._all
+    values['status'] = data.get('status') or ContactStat.inactive
+
+    values['image_url'] = image_url
+
+    # the core inserts below skip the orm event that sets these
+    values['fingerprint'] = contact_fingerprint(values['primary_first_name'], values['primary_last_name'],
+                                                values['primary_email'], values['primary_phone'])
+    values['primary_phone_key'] = phone_key(values['primary_phone'])
+    values['secondary_phone_key'] = phone_key(values['secondary_phone'])
+
+    return values
+
+
+def insert_contacts(user_id, contacts):
+    """ insert the contacts (dicts of column values) and link them to the user, in the current transaction. Returns
+    the ids of the new contacts"""
+
+    table = Contact.__table__
+
+    if db.engine.dialect.name == 'postgresql':
+        ## one multi-row insert handing back the new ids
+        result = db.session.execute(table.insert().values(contacts).returning(table.c.id))
+        contact_ids = [contact_id for (contact_id,) in result]
+    else:
+        contact_ids = [db.session.execute(table.insert().values(contact)).inserted_primary_key[0] for contact in contacts]
+
+    seq = next_contact_seq(user_id)
+    now = datetime.utcnow()
+    db.session.execute(UserContact.__table__.insert().values(
+        [{'user_id': user_id, 'contact_id': contact_id, 'change_seq': seq, 'updated_at': now} for contact_id in contact_ids]))
+
+    return contact_ids
+
+
+def import_contacts(user_id, rows, chunk_size=IMPORT_CHUNK_SIZE, start_row=0, checkpoint=None, policy=DEDUPE_POLICY):
+    """ import spreadsheet rows (dicts, empty cells as None or left out, see spreadsheet.read_rows) as contacts of
+    a user. Blank rows are skipped.
+
+    Rows are written and committed chunk_size at a time. Rows that duplicate one of the user's contacts, or an
+    earlier row, are merged or skipped depending on the policy (see dedupe.py). Returns an ImportResult.
+
+    To carry on with an import that stopped partway, pass start_row: rows up to that number are skipped. Before each
+    commit checkpoint(number) is called with the number of the last row written, within the transaction being
+    committed, so the progress it records always matches the contacts saved.
+    """
+
+    result = ImportResult()
+    chunk = []
+
+    for number, data in enumerate(rows, start=1):
+        if number <= start_row or not data:
+            ## already imported, or a blank row
+            continue
+
+        chunk.append((number, data))
+        if len(chunk) >= chunk_size:
+            import_chunk(user_id, chunk, result, checkpoint, policy)
+            chunk = []
+
+    if chunk:
+        import_chunk(user_id, chunk, result, checkpoint, policy)
+
+    return result
+
+
+def import_chunk(user_id, chunk, result, checkpoint, policy):
+    """ check a chunk of rows all at once, then write the ones that passed"""
+
+    clean, errors = validate_rows(chunk)
+    result.errors.extend(errors)
+    result.errors.sort()
+
+    if clean:
+        ## get random avatar picture for each contact, looking up each first name once for the whole chunk
+        images = get_contact_images([data['primary_first_name'] for (number, data) in clean])
+        contacts = [(number, convert_row(data, image)) for ((number, data), image) in zip(clean, images)]
+        write_chunk(user_id, contacts, result, checkpoint, policy)
+
+
+def write_chunk(user_id, chunk, result, checkpoint=None, policy=DEDUPE_POLICY):
+    """ write a chunk of converted rows. If the database rejects the chunk, the rows are written one at a time so
+    only the bad ones are left out"""
+
+    try:
+        save_rows(user_id, chunk, result, checkpoint, policy)
+        return
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    for number, values in chunk:
+        try:
+            save_rows(user_id, [(number, values)], result, checkpoint, policy)
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            result.errors.append((number, str(error.orig if hasattr(error, 'orig') else error)))
+
+
+def save_rows(user_id, rows, result, checkpoint, policy):
+    """ save converted rows and commit. Duplicates are looked up for all the rows in one go"""
+
+    new = {}
+    merged = []
+    skipped = 0
+
+    existing = find_duplicates(user_id, [values['fingerprint'] for (number, values) in rows]) if policy != 'keep' else {}
+
+    for number, values in rows:
+        fingerprint = values['fingerprint']
+        if policy == 'keep':
+            new[number] = values
+        elif fingerprint in existing:
+            if policy == 'merge' and merge_values(existing[fingerprint], values):
+                merged.append(existing[fingerprint])
+            skipped += policy == 'skip'
+        elif fingerprint in new:
+            if policy == 'merge':
+                merge_values(new[fingerprint], values)
+            skipped += policy == 'skip'
+        else:
+            new[fingerprint] = values
+
+    if new:
+        insert_contacts(user_id, list(new.values()))
+    if merged:
+        record_contact_changes(merged)
+    if checkpoint:
+        checkpoint(rows[-1][0])
+    db.session.commit()
+
+    result.imported += len(new)
+    result.merged += len(rows) - len(new) - skipped
+    result.skipped += skipped
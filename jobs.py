@@ -0,0 +1,153 @@
+"""Background jobs.
+
+    python jobs.py
+
+runs a worker that keeps taking jobs from the jobs table and running them. Work that is too slow for a request,
+like the file downloads and contact import of a typeform submission, is queued with enqueue() and done here.
+"""
+
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from models import db, Job, JobStatus
+from metrics import metrics
+
+# seconds between looks at the queue when it's empty
+POLL_INTERVAL = 5
+
+# seconds to wait before the first retry of a failed job, doubled for each further attempt
+RETRY_DELAY = 30
+
+# seconds after which a running job is taken to be lost (its worker died) and is run again
+JOB_TIMEOUT = 30 * 60
+
+# job kind: function called with the job
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """ decorator registering a function as the handler of a kind of job"""
+
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        return function
+
+    return register
+
+
+def enqueue(kind, payload, max_attempts=3, commit=True, key=None):
+    """ queue a job and return it. With commit=False the job is only added to the session, so it is queued
+    along with whatever else the current transaction does (or not at all if that is rolled back).
+
+    A job with a key is only queued once: if there already is a job with that key, that job is returned instead.
+    If it had failed, it is queued again and carries on from its progress.
+    """
+
+    if key is not None:
+        job = Job.query.filter_by(key=key).first()
+        if job:
+            if job.status == JobStatus.failed:
+                job.status = JobStatus.queued
+                job.attempts = 0
+                job.run_at = datetime.utcnow()
+                if commit:
+                    db.session.commit()
+            return job
+
+    job = Job(kind=kind, payload=payload, max_attempts=max_attempts, key=key)
+    db.session.add(job)
+
+    if commit:
+        try:
+            db.session.commit()
+        except IntegrityError:
+            ## queued by another request at the same time
+            db.session.rollback()
+            job = Job.query.filter_by(key=key).one()
+
+    return job
+
+
+def save_progress(job, progress):
+    """ record how far a job got, as part of the current transaction"""
+
+    Job.query.filter_by(id=job.id).update({Job.progress: progress}, synchronize_session=False)
+
+
+def claim_job():
+    """ mark the next job that is due as running and return it, None if there is nothing to do.
+
+    On postgres the row is locked with SKIP LOCKED, so workers running side by side never take the same job.
+    """
+
+    now = datetime.utcnow()
+
+    job = (Job.query
+           .filter(or_(and_(Job.status == JobStatus.queued, Job.run_at <= now),
+                       and_(Job.status == JobStatus.running, Job.started_at < now - timedelta(seconds=JOB_TIMEOUT))))
+           .order_by(Job.run_at, Job.id)
+           .with_for_update(skip_locked=True)
+           .first())
+
+    if job:
+        job.status = JobStatus.running
+        job.attempts += 1
+        job.started_at = now
+
+    db.session.commit()
+
+    return job
+
+
+def run_job(job):
+    """ run a claimed job. A job that raises is queued again later, or marked failed after its last attempt"""
+
+    try:
+        if job.attempts > job.max_attempts:
+            raise RuntimeError("the worker running the job stopped")
+
+        JOB_HANDLERS[job.kind](job)
+
+        job.status = JobStatus.done
+        job.last_error = None
+    except Exception:
+        db.session.rollback()
+        job.last_error = traceback.format_exc()
+
+        if job.attempts < job.max_attempts:
+            job.status = JobStatus.queued
+            job.run_at = datetime.utcnow() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = JobStatus.failed
+
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+    metrics.observe('job_duration_seconds', (('kind', job.kind), ('status', job.status.name)),
+                    (job.finished_at - job.started_at).total_seconds())
+    metrics.flush(force=True)
+
+    return job
+
+
+def work(burst=False):
+    """ run jobs as they come due. With burst=True, return once there is nothing left to do right now"""
+
+    while True:
+        job = claim_job()
+
+        if job:
+            run_job(job)
+        elif burst:
+            return
+        else:
+            time.sleep(POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    from app import app  # connects the database and registers the job handlers
+
+    work()
@@ -0,0 +1,319 @@
+import hmac
+import json
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock, local
+
+from flask import request, current_app, Response, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+##############################################################################
+# Metrics
+#
+# Each process counts its requests, their SQL queries and the stages of background jobs in memory, which costs a
+# few dict updates per request. About once a second a process writes its totals to a file of its own in
+# METRICS_DIR, and /metrics adds up the files of every process (the gunicorn workers, and a job worker on the same
+# machine) in the Prometheus text format. The files of processes that have exited are dropped, so their totals
+# stop counting (Prometheus sees that as a counter reset). With SERVER_TIMING on, responses also get a
+# Server-Timing header.
+#
+# Views declare how many SQL queries they may run with @query_budget. A request going over its view's budget is
+# logged as a warning and counted, and test_query_budgets.py fails when a view goes over it or runs more queries
+# for a user with more data.
+
+# seconds, the upper bounds of the histogram buckets of request times
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# seconds, for the stages of background jobs
+STAGE_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600)
+
+# bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name: (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled', None),
+    'http_request_duration_seconds': ('histogram', 'Time taken to handle a request', LATENCY_BUCKETS),
+    'http_response_size_bytes': ('histogram', 'Size of the response bodies', SIZE_BUCKETS),
+    'db_queries_per_request': ('histogram', 'SQL queries run by a request', QUERY_BUCKETS),
+    'db_query_seconds_per_request': ('histogram', 'Time a request spent in SQL queries', LATENCY_BUCKETS),
+    'job_duration_seconds': ('histogram', 'Time taken to run a background job', STAGE_BUCKETS),
+    'stage_duration_seconds': ('histogram', 'Time taken by a stage of a background job, like the typeform '
+                                            'download and import', STAGE_BUCKETS),
+    'query_budget_exceeded_total': ('counter', "Requests that ran more SQL queries than their view's budget", None),
+}
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'jane-metrics'))
+
+# seconds between writes of a process's totals
+FLUSH_INTERVAL = 1
+
+# when set, /metrics needs an "Authorization: Bearer <token>" header. Unset, /metrics is only served in debug and
+# testing mode
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# the queries of the current request (or job) of this thread, and the count_queries blocks it is in
+current = local()
+
+
+class Metrics:
+    """The counters and histograms of this process, keyed by metric name and labels (a tuple of (label, value)).
+
+    A counter is a number. A histogram is a list of the number of values in each bucket, then the number above the
+    last bucket, then the sum of the values.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.lock = Lock()
+        self.flushed = time.monotonic()
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(buckets) + 2)
+            counts[bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        """ the values as a list of [name, labels, value], which json can write"""
+
+        with self.lock:
+            return [[name, labels, list(value) if isinstance(value, list) else value]
+                    for ((name, labels), value) in self.values.items()]
+
+    def flush(self, force=False):
+        """ write the values to this process's file in METRICS_DIR, at most once every FLUSH_INTERVAL seconds
+        unless forced"""
+
+        now = time.monotonic()
+        if not force and now - self.flushed < FLUSH_INTERVAL:
+            return
+        self.flushed = now
+
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with open(path + '.tmp', 'w') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            ## metrics are never worth failing a request over
+            pass
+
+
+metrics = Metrics()
+
+
+def collect():
+    """ the values of every process that wrote to METRICS_DIR, added up. This process's come from memory"""
+
+    totals = {}
+    snapshots = [metrics.snapshot()]
+
+    remove_dead_metrics()
+
+    own = f"{os.getpid()}.json"
+    for name in os.listdir(METRICS_DIR) if os.path.isdir(METRICS_DIR) else []:
+        if name.endswith('.json') and name != own:
+            try:
+                with open(os.path.join(METRICS_DIR, name)) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+
+    for snapshot in snapshots:
+        for name, labels, value in snapshot:
+            if name not in METRICS:
+                continue
+            key = (name, tuple(tuple(label) for label in labels))
+            if isinstance(value, list):
+                total = totals.setdefault(key, [0] * len(value))
+                totals[key] = [a + b for (a, b) in zip(total, value)]
+            else:
+                totals[key] = totals.get(key, 0) + value
+
+    return totals
+
+
+def label_text(labels):
+    """ labels as Prometheus writes them, {endpoint="views.login",method="GET"}"""
+
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+    return '{' + ','.join(f'{label}="{escape(value)}"' for (label, value) in labels) + '}' if labels else ''
+
+
+def render(totals):
+    """ the totals in the Prometheus text format"""
+
+    lines = []
+
+    for name, (kind, help, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        for (key_name, labels), value in sorted(totals.items()):
+            if key_name != name:
+                continue
+            if kind == 'counter':
+                lines.append(f"{name}{label_text(labels)} {value}")
+                continue
+
+            count = 0
+            for bound, in_bucket in zip(buckets + ('+Inf',), value):
+                count += in_bucket
+                lines.append(f"{name}_bucket{label_text(labels + (('le', bound),))} {count}")
+            lines.append(f"{name}_sum{label_text(labels)} {value[-1]}")
+            lines.append(f"{name}_count{label_text(labels)} {count}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        ## running, as another user
+        return True
+
+    return True
+
+
+def remove_dead_metrics():
+    """ delete the files in METRICS_DIR written by processes that are no longer running"""
+
+    for name in os.listdir(METRICS_DIR) if os.path.isdir(METRICS_DIR) else []:
+        pid = name.split('.')[0]
+        if pid.isdigit() and pid_running(int(pid)):
+            continue
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except OSError:
+            pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_query(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.query_start
+    current.queries = getattr(current, 'queries', 0) + 1
+    current.query_time = getattr(current, 'query_time', 0) + elapsed
+
+    for counter in getattr(current, 'counters', ()):
+        counter.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """ collect the SQL statements this thread runs in the block: with count_queries() as statements: ...
+    len(statements) is how many there were"""
+
+    statements = []
+    current.counters = getattr(current, 'counters', ()) + (statements,)
+    try:
+        yield statements
+    finally:
+        current.counters = tuple(counter for counter in current.counters if counter is not statements)
+
+
+def query_budget(queries):
+    """ decorator declaring the most SQL queries a view may run, however much data the user has"""
+
+    def declare(view):
+        view.query_budget = queries
+        return view
+
+    return declare
+
+
+def start_request():
+    current.start = time.perf_counter()
+    current.queries = 0
+    current.query_time = 0
+
+
+def finish_request(response):
+    """ count the request, and add the Server-Timing header if it's on"""
+
+    if not hasattr(current, 'start'):
+        return response
+
+    elapsed = time.perf_counter() - current.start
+    labels = (('endpoint', request.endpoint or 'none'), ('method', request.method))
+
+    metrics.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+    metrics.observe('http_request_duration_seconds', labels, elapsed)
+    metrics.observe('db_queries_per_request', labels, current.queries)
+    metrics.observe('db_query_seconds_per_request', labels, current.query_time)
+    ## streamed responses (like files) don't know their size up front, and aren't read to find it out
+    if response.content_length is not None:
+        metrics.observe('http_response_size_bytes', labels, response.content_length)
+
+    budget = getattr(current_app.view_functions.get(request.endpoint), 'query_budget', None)
+    if budget is not None and current.queries > budget:
+        current_app.logger.warning(f"{request.endpoint} ran {current.queries} SQL queries, its budget is {budget}")
+        metrics.inc('query_budget_exceeded_total', (('endpoint', request.endpoint),))
+
+    if current_app.config.get('SERVER_TIMING'):
+        response.headers['Server-Timing'] = (f'db;desc="{current.queries} queries";dur={current.query_time * 1000:.1f}, '
+                                             f'app;dur={elapsed * 1000:.1f}')
+
+    del current.start
+    metrics.flush()
+
+    return response
+
+
+@contextmanager
+def timed(stage):
+    """ time a stage of a background job: with timed('typeform_download'): ..."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe('stage_duration_seconds', (('stage', stage),), elapsed)
+
+
+def show_metrics():
+    """ the metrics of every process, for Prometheus"""
+
+    ## the traffic of a live app isn't for everyone to see, without a token it is only served in development
+    if not METRICS_TOKEN:
+        if not (current_app.debug or current_app.testing):
+            abort(404)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        abort(401)
+
+    return Response(render(collect()), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """ count the requests of the app and serve /metrics"""
+
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', 'metrics', query_budget(0)(show_metrics))
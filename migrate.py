@@ -0,0 +1,222 @@
+"""Set up the database, or bring an existing one up to date with the models.
+
+    python migrate.py           run the steps this database hasn't had yet
+    python migrate.py status    list the steps and when each one ran
+
+db.create_all() creates missing tables but never changes tables that already exist. Each step below makes one of
+those changes to an existing database. The steps that ran are recorded in the schema_migrations table, and only
+new ones run. Every step also checks what is already there, so running one again is safe.
+
+To change the schema, add a step at the end of STEPS and update the models to match. Steps are never reordered
+or renamed, since they are recorded by name.
+"""
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text, func
+
+from app import app  # connects the database
+from models import db, UserFile, UserFileVariant, USER_FILE_KINDS, sniff_content_type, contact_fingerprint, phone_key
+from search import rebuild_search_index
+
+
+# the steps that ran on this database
+schema_migrations = db.Table('schema_migrations',
+                             db.Column('name', db.Text, primary_key=True),
+                             db.Column('applied_at', db.DateTime, nullable=False))
+
+
+def column_names(table):
+    """ names of the columns a table has in the database"""
+
+    return {column['name'] for column in inspect(db.engine).get_columns(table)}
+
+
+def add_column(table, column, definition):
+    """ add a column to a table, unless it's already there"""
+
+    if column not in column_names(table):
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+
+def add_contact_search():
+    """ contacts.search_document and the contact search indexes"""
+
+    rebuild_search_index()
+
+
+def add_contact_changes():
+    """ change tracking for /api/contacts/changes"""
+
+    add_column('users', 'contact_seq', 'INTEGER NOT NULL DEFAULT 0')
+    add_column('contacts', 'updated_at', 'TIMESTAMP')
+    add_column('users_contacts', 'change_seq', 'INTEGER NOT NULL DEFAULT 0')
+    add_column('users_contacts', 'updated_at', 'TIMESTAMP')
+
+    db.session.execute(text("UPDATE contacts SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"))
+    db.session.execute(text("UPDATE users_contacts SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"))
+
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_contacts_last_name_id ON contacts (primary_last_name, id)"))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_users_contacts_user_id_change_seq "
+                            "ON users_contacts (user_id, change_seq)"))
+
+
+def add_user_files():
+    """ the user_files and user_file_variants tables (see files.py)"""
+
+    UserFile.__table__.create(db.engine, checkfirst=True)
+    add_column('user_files', 'content_type', "TEXT NOT NULL DEFAULT 'application/octet-stream'")
+    UserFileVariant.__table__.create(db.engine, checkfirst=True)
+
+    if db.engine.dialect.name == 'postgresql':
+        for table in ['user_files', 'user_file_variants']:
+            db.session.execute(text(f"ALTER TABLE {table} ALTER COLUMN content SET STORAGE EXTERNAL"))
+
+    # only the first bytes of each file are needed to tell its type
+    untyped = UserFile.query.filter_by(content_type='application/octet-stream').all()
+    for file in untyped:
+        head = db.session.query(func.substr(UserFile.content, 1, 16)).filter(UserFile.id == file.id).scalar()
+        file.content_type = sniff_content_type(bytes(head))
+
+
+def move_user_files():
+    """ move the uploaded files out of the users table into user_files"""
+
+    for kind in USER_FILE_KINDS:
+        if kind not in column_names('users'):
+            continue
+
+        user_ids = [user_id for (user_id,) in db.session.execute(text(f"SELECT id FROM users WHERE {kind} IS NOT NULL"))]
+
+        # one file at a time, so only one of them is ever in memory
+        for user_id in user_ids:
+            if not UserFile.query.filter_by(user_id=user_id, kind=kind).count():
+                content = db.session.execute(text(f"SELECT {kind} FROM users WHERE id = :id"), {'id': user_id}).scalar()
+                file = UserFile(user_id=user_id, kind=kind)
+                file.set_content(bytes(content))
+                db.session.add(file)
+                db.session.commit()
+                db.session.expunge(file)
+
+        db.session.execute(text(f"ALTER TABLE users DROP COLUMN {kind}"))
+        db.session.commit()
+
+
+def add_users_contacts_unique_index():
+    """ remove duplicate user/contact links and make (user_id, contact_id) unique"""
+
+    db.session.execute(text("DELETE FROM users_contacts WHERE id NOT IN "
+                            "(SELECT MIN(id) FROM users_contacts GROUP BY user_id, contact_id)"))
+    db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_users_contacts_user_id_contact_id "
+                            "ON users_contacts (user_id, contact_id)"))
+
+
+def add_job_keys():
+    """ job keys, so webhook deliveries are only processed once, and job progress"""
+
+    add_column('jobs', 'key', 'TEXT')
+    add_column('jobs', 'progress', 'INTEGER NOT NULL DEFAULT 0')
+    db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_key ON jobs (key)"))
+
+
+def add_contact_fingerprints():
+    """ contacts.fingerprint, for finding duplicate contacts (see dedupe.py)"""
+
+    add_column('contacts', 'fingerprint', 'VARCHAR(40)')
+
+    # filled in a batch at a time, with one executemany per batch
+    while True:
+        rows = db.session.execute(text("SELECT id, primary_first_name, primary_last_name, primary_email, primary_phone "
+                                       "FROM contacts WHERE fingerprint IS NULL LIMIT 5000")).fetchall()
+        if not rows:
+            break
+        db.session.execute(text("UPDATE contacts SET fingerprint = :fingerprint WHERE id = :id"),
+                           [{'id': row[0], 'fingerprint': contact_fingerprint(*row[1:])} for row in rows])
+        db.session.commit()
+
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_contacts_fingerprint ON contacts (fingerprint)"))
+
+
+def add_contact_phone_keys():
+    """ contacts.primary_phone_key and secondary_phone_key, for /api/lookup"""
+
+    add_column('contacts', 'primary_phone_key', 'VARCHAR(20)')
+    add_column('contacts', 'secondary_phone_key', 'VARCHAR(20)')
+
+    # a batch at a time in id order, since phones that aren't valid numbers stay without a key
+    last_id = 0
+    while True:
+        rows = db.session.execute(text("SELECT id, primary_phone, secondary_phone FROM contacts "
+                                       "WHERE id > :last_id AND (primary_phone IS NOT NULL OR secondary_phone IS NOT NULL) "
+                                       "ORDER BY id LIMIT 5000"), {'last_id': last_id}).fetchall()
+        if not rows:
+            break
+        db.session.execute(text("UPDATE contacts SET primary_phone_key = :primary, secondary_phone_key = :secondary "
+                                "WHERE id = :id"),
+                           [{'id': row[0], 'primary': phone_key(row[1]), 'secondary': phone_key(row[2])} for row in rows])
+        db.session.commit()
+        last_id = rows[-1][0]
+
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_contacts_primary_phone_key ON contacts (primary_phone_key)"))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_contacts_secondary_phone_key "
+                            "ON contacts (secondary_phone_key)"))
+
+
+def add_user_lookup_indexes():
+    """ lower case user emails, make them unique, and index user names for typeform"""
+
+    conflicts = db.session.execute(text("SELECT lower(trim(email)) FROM users GROUP BY lower(trim(email)) "
+                                        "HAVING COUNT(*) > 1")).fetchall()
+    if conflicts:
+        raise RuntimeError("these emails belong to more than one user once lower cased, merge those users and "
+                           "migrate again: " + ', '.join(email for (email,) in conflicts))
+
+    db.session.execute(text("UPDATE users SET email = lower(trim(email)) WHERE email <> lower(trim(email))"))
+    db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_users_email ON users (email)"))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_users_first_name_last_name ON users (first_name, last_name)"))
+
+
+STEPS = [add_contact_search, add_contact_changes, add_user_files, move_user_files, add_users_contacts_unique_index,
+         add_job_keys, add_contact_fingerprints, add_contact_phone_keys, add_user_lookup_indexes]
+
+
+def applied_steps():
+    """ dict of step name: when it ran, for the steps recorded in schema_migrations"""
+
+    schema_migrations.create(db.engine, checkfirst=True)
+
+    return dict(db.session.execute(schema_migrations.select()).fetchall())
+
+
+def migrate():
+    """ create the missing tables, then run the steps that haven't run yet, in order"""
+
+    db.create_all()
+    applied = applied_steps()
+
+    for step in STEPS:
+        if step.__name__ in applied:
+            continue
+        print(f"{step.__name__}: {step.__doc__.strip()}")
+        step()
+        db.session.execute(schema_migrations.insert().values(name=step.__name__, applied_at=datetime.utcnow()))
+        db.session.commit()
+
+
+def status():
+    """ print each step and when it ran"""
+
+    applied = applied_steps()
+
+    for step in STEPS:
+        print(f"{step.__name__:<35} {applied.get(step.__name__, 'pending')}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['status']:
+        status()
+    elif sys.argv[1:]:
+        sys.exit(__doc__)
+    else:
+        migrate()
@@ -1,11 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
-from sqlalchemy.orm import backref
+from sqlalchemy.orm import backref, validates
 from datetime import datetime
+from usercache import user_cache
+from passwords import hash_password, check_password, check_dummy_password, needs_rehash, PasswordBusy
 
 import enum
+import hashlib
 
-bcrypt = Bcrypt()
 db = SQLAlchemy()
 
 
@@ -44,10 +45,43 @@ class MailOptions(enum.Enum):
     holiday = "Holiday only"
 
 
+# phone numbers without a country code are taken to be from here
+PHONE_REGION = 'US'
+
+
+# kinds of files a user uploads during onboarding (see typeform.py)
+USER_FILE_KINDS = ['broker_logo_one', 'broker_logo_two', 'logo', 'headshot', 'signature', 'database',
+                   'listing_docs', 'buyers_docs', 'bio']
+
+
+def user_file_property(kind):
+    """ attribute giving the content of one of the user's files, as bytes (None if there is no such file)"""
+
+    def get_content(user):
+        return user.get_file(kind)
+
+    def set_content(user, content):
+        user.set_file(kind, content)
+
+    return property(get_content, set_content)
+
+
+def normalize_email(email):
+    """ an email address the way it is stored and looked up: lower case, without surrounding spaces"""
+
+    return email.strip().lower() if email else email
+
+
 class User(db.Model):
     """Site user."""
 
     __tablename__ = "users"
+    __table_args__ = (
+        # logins look users up by email, which is stored lower cased (see normalize_email)
+        db.Index('uq_users_email', 'email', unique=True),
+        # typeform responses are matched to users by name, see extract_typeform_answers
+        db.Index('ix_users_first_name_last_name', 'first_name', 'last_name'),
+    )
 
     id = db.Column(
         db.Integer,
@@ -70,6 +104,9 @@ class User(db.Model):
     has_paid = db.Column(db.Boolean, default=True)
     reset_token = db.Column(db.Text)
 
+    # bumped every time one of the user's contacts changes, see record_contact_changes
+    contact_seq = db.Column(db.Integer, nullable=False, default=0)
+
     # typeform answers
     designation = db.Column(db.Text)
     certifications = db.Column(db.Text)
@@ -79,11 +116,6 @@ class User(db.Model):
     office_address = db.Column(db.Text)
     mls_info = db.Column(db.Text)
     broker_info = db.Column(db.Text)
-    broker_logo_one = db.Column(db.LargeBinary)
-    broker_logo_two = db.Column(db.LargeBinary)
-    logo = db.Column(db.LargeBinary)
-    headshot = db.Column(db.LargeBinary)
-    signature = db.Column(db.LargeBinary)
     tagline = db.Column(db.Text)
     website_info = db.Column(db.Text)
     zillow_info = db.Column(db.Text)
@@ -91,10 +123,19 @@ class User(db.Model):
     insta_info = db.Column(db.Text)
     address_book_info = db.Column(db.Text)
     email_acct_info = db.Column(db.Text)
-    database = db.Column(db.LargeBinary)
-    listing_docs = db.Column(db.LargeBinary)
-    buyers_docs = db.Column(db.LargeBinary)
-    bio = db.Column(db.LargeBinary)
+
+    # uploaded typeform files. The content lives in the user_files table and is only loaded when it is used.
+    broker_logo_one = user_file_property('broker_logo_one')
+    broker_logo_two = user_file_property('broker_logo_two')
+    logo = user_file_property('logo')
+    headshot = user_file_property('headshot')
+    signature = user_file_property('signature')
+    database = user_file_property('database')
+    listing_docs = user_file_property('listing_docs')
+    buyers_docs = user_file_property('buyers_docs')
+    bio = user_file_property('bio')
+
+    files = db.relationship('UserFile', backref='user', cascade='all, delete-orphan')
 
     # creating a connection user object and
     contacts = db.relationship(
@@ -110,12 +151,10 @@ class User(db.Model):
     def register(cls, email, pwd, first_name, last_name):
         """Register user w/hashed password & return user."""
 
-        hashed = bcrypt.generate_password_hash(pwd)
-        # turn bytestring into normal (unicode utf8) string
-        hashed_utf8 = hashed.decode("utf8")
+        hashed = hash_password(pwd)
 
         # return instance of user w/username and hashed pwd
-        return cls(email=email, password=hashed_utf8,  first_name=first_name, last_name=last_name)
+        return cls(email=email, password=hashed,  first_name=first_name, last_name=last_name)
     # end_register
 
     # start_authenticate
@@ -123,24 +162,173 @@ class User(db.Model):
     def authenticate(cls, email, pwd):
         """Validate that user exists & password is correct.
 
-        Return user if valid; else return False.
+        Return user if valid; else return False. Raises PasswordBusy (see passwords.py) when too many
+        passwords are being checked already.
         """
 
-        u = User.query.filter_by(email=email).first()
-
-        if u and bcrypt.check_password_hash(u.password, pwd):
+        u = User.query.filter_by(email=normalize_email(email)).first()
+
+        ## an unknown email is checked against a dummy hash, so it takes as long as a wrong password
+        if not u:
+            return check_dummy_password(pwd)
+
+        if check_password(u.password, pwd):
+            # hashes made with an old cost are made again now that we have the password
+            if needs_rehash(u.password):
+                ## the password is right either way. When the pool is busy the hash is made at the next login
+                try:
+                    u.update_password(pwd)
+                    db.session.commit()
+                except PasswordBusy:
+                    pass
             # return user instance
             return u
         else:
             return False
     # end_authenticate
 
+    @validates('email')
+    def validate_email(self, key, email):
+        """ emails are stored the way normalize_email writes them"""
+
+        return normalize_email(email)
+
+    def find_file(self, kind):
+        """ returns the user's UserFile of this kind, or None"""
+
+        for file in self.files:
+            if file.kind == kind:
+                return file
+
+    def get_file(self, kind):
+        """ returns the content of the user's file of this kind, or None"""
+
+        file = self.find_file(kind)
+
+        return file.content if file else None
+
+    def set_file(self, kind, content):
+        """ replace the content of the user's file of this kind. None removes the file"""
+
+        file = self.find_file(kind)
+
+        if content is None:
+            if file:
+                self.files.remove(file)
+        elif file:
+            file.set_content(content)
+        else:
+            file = UserFile(kind=kind)
+            file.set_content(content)
+            self.files.append(file)
+
     def update_password(self, pwd):
-        hashed = bcrypt.generate_password_hash(pwd)
-        # turn bytestring into normal (unicode utf8) string
-        hashed_utf8 = hashed.decode("utf8")
+        self.password = hash_password(pwd)
+
+        user_cache.invalidate(self.id)
+
+
+# leading bytes of the file types users upload, to tell what a file is
+FILE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+]
+
+
+def sniff_content_type(content):
+    """ guess the content type of a file from its first bytes"""
+
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'image/webp'
+
+    for signature, content_type in FILE_SIGNATURES:
+        if content.startswith(signature):
+            return content_type
+
+    return 'application/octet-stream'
+
+
+class UserFile(db.Model):
+    """A file uploaded by a user. The content is deferred: loading a UserFile doesn't load the content until it is used."""
+
+    __tablename__ = 'user_files'
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'kind'),)
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
 
-        self.password = hashed_utf8
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False
+    )
+
+    kind = db.Column(db.String(30), nullable=False)
+
+    content = db.deferred(db.Column(db.LargeBinary, nullable=False))
+
+    # sha256 of the content
+    content_hash = db.Column(db.String(64), nullable=False)
+
+    size = db.Column(db.Integer, nullable=False)
+
+    content_type = db.Column(db.Text, nullable=False, default='application/octet-stream')
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # resized or converted copies of image files, made when they are first asked for (see files.py)
+    variants = db.relationship('UserFileVariant', backref='file', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f"<UserFile user_id={self.user_id} kind={self.kind} size={self.size}>"
+
+    def set_content(self, content):
+        """ store new content along with its hash, size and type. Variants of the old content are dropped"""
+
+        self.content = content
+        self.content_hash = hashlib.sha256(content).hexdigest()
+        self.size = len(content)
+        self.content_type = sniff_content_type(content)
+        self.variants = []
+
+
+class UserFileVariant(db.Model):
+    """A resized or converted copy of an uploaded image, e.g. a thumbnail"""
+
+    __tablename__ = 'user_file_variants'
+
+    __table_args__ = (db.UniqueConstraint('file_id', 'name'),)
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    file_id = db.Column(
+        db.Integer,
+        db.ForeignKey('user_files.id', ondelete='cascade'),
+        nullable=False
+    )
+
+    name = db.Column(db.String(30), nullable=False)
+
+    content = db.deferred(db.Column(db.LargeBinary, nullable=False))
+
+    content_hash = db.Column(db.String(64), nullable=False)
+
+    size = db.Column(db.Integer, nullable=False)
+
+    content_type = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f"<UserFileVariant file_id={self.file_id} name={self.name} size={self.size}>"
 
 
 class Property(db.Model):
@@ -161,11 +349,93 @@ class Property(db.Model):
         return f"<Property {self.address}, {self.city}, {self.state}>"
 
 
+# contact columns that make up the search document used by the contact search
+CONTACT_SEARCH_FIELDS = ['primary_first_name', 'primary_last_name', 'secondary_first_name', 'secondary_last_name',
+                         'primary_email', 'secondary_email', 'primary_phone', 'secondary_phone', 'notes',
+                         'address', 'suite', 'city', 'state', 'zip_code']
+
+
+# contact attributes in the JSON representation of a contact. Empty ones are sent as "None"
+CONTACT_ATTRIBUTE_FIELDS = ['primary_first_name', 'primary_last_name', 'secondary_first_name', 'secondary_last_name',
+                            'primary_email', 'secondary_email', 'primary_phone', 'secondary_phone', 'primary_DOB',
+                            'secondary_DOB', 'past_client', 'notes', 'address', 'suite', 'city', 'state', 'zip_code']
+
+# every column needed to build the JSON representation of a contact (and is_visible for the changes api)
+CONTACT_SERIALIZED_FIELDS = ['id', 'image_url', 'is_visible'] + CONTACT_ATTRIBUTE_FIELDS
+
+
+def format_address(address, suite, city, state, zip_code):
+    """ Format a contact address into a usable string"""
+    if address:
+        if suite:
+            return f"{address}, {suite}, {city}, {state} {zip_code}"
+        else:
+            return f"{address}, {city}, {state} {zip_code}"
+    else:
+        return "None"
+
+
+def format_secondary_name(first, last):
+    """ Format secondary first name and last name to be a usable string"""
+    if first and last:
+        return f"{first} {last}"
+    elif first:
+        return first
+    elif last: 
+        return last
+    else:
+        return "None"
+
+
+def normalize_phone(phone):
+    """ the digits of a phone number, without the leading 1 of US numbers"""
+
+    digits = ''.join(c for c in phone or '' if c.isdigit())
+
+    return digits[1:] if len(digits) == 11 and digits.startswith('1') else digits
+
+
+def phone_key(phone):
+    """ a phone number in E.164 form (+12065550100), the indexed key phone lookups go by. None if it isn't a
+    phone number"""
+
+    if not phone:
+        return None
+
+    import phonenumbers  # only loaded once a phone number is looked at
+
+    try:
+        number = phonenumbers.parse(phone, PHONE_REGION)
+    except phonenumbers.NumberParseException:
+        return None
+
+    if not phonenumbers.is_possible_number(number):
+        return None
+
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+def contact_fingerprint(first_name, last_name, email, phone):
+    """ sha1 of a contact's normalized primary name, email and phone. Contacts of a user with the same fingerprint
+    are taken to be the same person (see dedupe.py)"""
+
+    parts = [' '.join((first_name or '').lower().split()), ' '.join((last_name or '').lower().split()),
+             (email or '').strip().lower(), normalize_phone(phone)]
+
+    return hashlib.sha1('|'.join(parts).encode('utf8')).hexdigest()
+
+
 class Contact(db.Model):
     """Agent contacts"""
 
     __tablename__ = "contacts"
 
+    # keyset pagination index, see pagination.py
+    __table_args__ = (db.Index('ix_contacts_last_name_id', 'primary_last_name', 'id'),
+                      db.Index('ix_contacts_fingerprint', 'fingerprint'),
+                      db.Index('ix_contacts_primary_phone_key', 'primary_phone_key'),
+                      db.Index('ix_contacts_secondary_phone_key', 'secondary_phone_key'))
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -213,6 +483,21 @@ class Contact(db.Model):
 
     is_visible = db.Column(db.Boolean, nullable=False, default=True)
 
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # see contact_fingerprint, set whenever the contact is saved
+    fingerprint = db.Column(db.String(40))
+
+    # the phones in E.164 form (see phone_key), set whenever the contact is saved
+    primary_phone_key = db.Column(db.String(20))
+
+    secondary_phone_key = db.Column(db.String(20))
+
+    # lower cased copy of all the searchable fields, kept up to date by the database. See search.py for the indexes.
+    search_document = db.Column(db.Text, db.Computed(
+        "lower(" + " || ' ' || ".join(f"coalesce({field}, '')" for field in CONTACT_SEARCH_FIELDS) + ")",
+        persisted=True))
+
     tags = db.relationship(
         'Tag',
         secondary="contacts_tags", backref= 'contacts'
@@ -220,46 +505,50 @@ class Contact(db.Model):
 
     def serialize(self, attr=None):
         """Returns a dict representation of Contact which we can turn into JSON. Excludes mail preference, and status"""
-        return {
-            'id': self.id,
-            'primary_first_name': self.get_contact_attribute('primary_first_name'),
-            'primary_last_name': self.get_contact_attribute('primary_last_name'),
-            'secondary_first_name': self.get_contact_attribute('secondary_first_name'),
-            'secondary_last_name': self.get_contact_attribute('secondary_last_name'),
-            'primary_email': self.get_contact_attribute('primary_email'), 
-            'secondary_email': self.get_contact_attribute('secondary_email'),
-            'primary_phone': self.get_contact_attribute('primary_phone'),
-            'secondary_phone': self.get_contact_attribute('secondary_phone'),
-            'primary_DOB': self.get_contact_attribute('primary_DOB'),
-            'secondary_DOB': self.get_contact_attribute('secondary_DOB'),
-            'past_client': self.get_contact_attribute('past_client'),
-            'notes': self.get_contact_attribute('notes'),
-            'image_url': self.get_contact_attribute('image_url'),
-            'address': self.get_contact_attribute('address'),
-            'suite': self.get_contact_attribute('suite'),
-            'city': self.get_contact_attribute('city'),
-            'state': self.get_contact_attribute('state'),
-            'zip_code': self.get_contact_attribute('zip_code'),
-            'tags': self.get_contact_attribute('tags'),
-            'image_url': self.image_url,
-            'get_address': self.get_address(),
-            'get_primary_name': self.get_primary_name(),
-            'get_seondary_name': self.get_secondary_name()
-            
-        }
+        data = {name: getattr(self, name) for name in CONTACT_SERIALIZED_FIELDS}
+
+        return Contact.serialize_row(data, [tag.name for tag in self.tags])
+
+    @staticmethod
+    def serialize_row(data, tags):
+        """Same as serialize, but for a dict of contact fields (see CONTACT_SERIALIZED_FIELDS) and a list of tag names.
+
+        Attributes that are empty come out as the string "None".
+        """
+        serialized = {name: data[name] or "None" for name in CONTACT_ATTRIBUTE_FIELDS}
+
+        serialized.update({
+            'id': data['id'],
+            'tags': tags or "None",
+            'image_url': data['image_url'],
+            'get_address': format_address(data['address'], data['suite'], data['city'], data['state'], data['zip_code']),
+            'get_primary_name': f"{data['primary_first_name']} {data['primary_last_name']}",
+            'get_seondary_name': format_secondary_name(data['secondary_first_name'], data['secondary_last_name'])
+        })
+
+        return serialized
+
+    @classmethod
+    def select_serialized(cls, query):
+        """Narrow a Contact query down to the columns serialize_rows needs, so no Contact objects get built."""
+
+        return query.with_entities(*[getattr(cls, name) for name in CONTACT_SERIALIZED_FIELDS])
+
+    @classmethod
+    def serialize_rows(cls, rows):
+        """Serialize the rows of a select_serialized query, loading the tags of all of them in one go"""
+
+        rows = [row._asdict() for row in rows]
+        tags = tag_names_by_contact([row['id'] for row in rows])
+
+        return [cls.serialize_row(row, tags.get(row['id'])) for row in rows]
 
     def __repr__(self):
         return f"<Contact {self.id} first_name ={self.primary_first_name} last_name ={self.primary_last_name}>"
 
     def get_address(self):
         """ Format the contact address into a usable string"""
-        if self.address:
-            if self.suite:
-                return f"{self.address}, {self.suite}, {self.city}, {self.state} {self.zip_code}"
-            else:
-                return f"{self.address}, {self.city}, {self.state} {self.zip_code}"
-        else:
-            return "None"
+        return format_address(self.address, self.suite, self.city, self.state, self.zip_code)
 
     def get_primary_name(self): 
         """ Format primary first name and last name to be a usable string"""
@@ -267,16 +556,7 @@ class Contact(db.Model):
 
     def get_secondary_name(self): 
         """ Format secondary first name and last name to be a usable string"""
-        first= self.secondary_first_name
-        last=self.secondary_last_name
-        if first and last:
-            return f"{first} {last}"
-        elif first:
-            return first
-        elif last: 
-            return second
-        else:
-            return "None"
+        return format_secondary_name(self.secondary_first_name, self.secondary_last_name)
 
     def get_contact_attribute(self, name):
         """ returns a certain attribute for a contact in string form.  If it doesnt exist, "none" is returned"""
@@ -289,11 +569,29 @@ class Contact(db.Model):
     # add Sold or bought former properties.
 
 
+def set_contact_keys(mapper, connection, contact):
+    contact.fingerprint = contact_fingerprint(contact.primary_first_name, contact.primary_last_name,
+                                              contact.primary_email, contact.primary_phone)
+    contact.primary_phone_key = phone_key(contact.primary_phone)
+    contact.secondary_phone_key = phone_key(contact.secondary_phone)
+
+
+db.event.listen(Contact, 'before_insert', set_contact_keys)
+db.event.listen(Contact, 'before_update', set_contact_keys)
+
+
 class UserContact(db.Model):
     """Mapping users to contacts."""
 
     __tablename__ = 'users_contacts'
 
+    __table_args__ = (
+        # a contact is linked to a user once. Also makes user_owns_contact a single index lookup
+        db.Index('uq_users_contacts_user_id_contact_id', 'user_id', 'contact_id', unique=True),
+        # finding a user's changed contacts, see record_contact_changes
+        db.Index('ix_users_contacts_user_id_change_seq', 'user_id', 'change_seq'),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True
@@ -309,6 +607,53 @@ class UserContact(db.Model):
         db.ForeignKey('contacts.id', ondelete='cascade')
     )
 
+    # the user's contact_seq when the contact last changed
+    change_seq = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+def user_owns_contact(user_id, contact_id):
+    """Is the contact one of the user's contacts? A single indexed EXISTS query, however many contacts the user has."""
+
+    link = UserContact.query.filter_by(user_id=user_id, contact_id=contact_id)
+
+    return db.session.query(link.exists()).scalar()
+
+
+def next_contact_seq(user_id):
+    """Bump the user's contact_seq and return the new number"""
+
+    User.query.filter_by(id=user_id).update({User.contact_seq: User.contact_seq + 1}, synchronize_session=False)
+
+    return db.session.query(User.contact_seq).filter_by(id=user_id).scalar()
+
+
+def record_contact_changes(contacts):
+    """Mark contacts as changed for every user they belong to.
+
+    Each user's contact_seq goes up by one and the changed contacts get the new number, so a client that
+    has seen everything up to some number can ask for just what changed since (see /api/contacts/changes).
+    Call this after adding or editing the contacts and before committing.
+    """
+
+    # new contacts and their links need ids first
+    db.session.flush()
+
+    contact_ids = [contact.id for contact in contacts]
+    if not contact_ids:
+        return
+
+    user_ids = [user_id for (user_id,) in db.session.query(UserContact.user_id)
+                .filter(UserContact.contact_id.in_(contact_ids)).distinct()]
+
+    for user_id in user_ids:
+        seq = next_contact_seq(user_id)
+
+        (UserContact.query
+         .filter(UserContact.user_id == user_id, UserContact.contact_id.in_(contact_ids))
+         .update({UserContact.change_seq: seq, UserContact.updated_at: datetime.utcnow()}, synchronize_session=False))
+
 
 class Transaction(db.Model):
     """transactions involving user contacts"""
@@ -412,6 +757,21 @@ class Tag(db.Model):
         return f"<Tag id={t.id} name={t.name}>"
 
 
+def tag_names_by_contact(contact_ids, chunk_size=500):
+    """Returns a dict of contact id to the names of the contact's tags, for all the contacts at once"""
+
+    names = {}
+    for start in range(0, len(contact_ids), chunk_size):
+        rows = (db.session.query(ContactTag.contact_id, Tag.name)
+                .join(Tag, Tag.id == ContactTag.tag_id)
+                .filter(ContactTag.contact_id.in_(contact_ids[start:start + chunk_size]))
+                .order_by(Tag.id))
+        for contact_id, name in rows:
+            names.setdefault(contact_id, []).append(name)
+
+    return names
+
+
 class ContactTag(db.Model):
     """ Contact_Tag model for Jane Rothe app"""
 
@@ -423,4 +783,55 @@ class ContactTag(db.Model):
 
     def __repr__(self):
         c= self
-        return f"<Contact_tag contact_id={c.contact_id} tag_id= {c.tag_id}>"
\ No newline at end of file
+        return f"<Contact_tag contact_id={c.contact_id} tag_id= {c.tag_id}>"
+
+class JobStatus(enum.Enum):
+    queued = "Queued"
+    running = "Running"
+    done = "Done"
+    failed = "Failed"
+
+
+class Job(db.Model):
+    """A piece of background work, like processing a typeform submission (see jobs.py)"""
+
+    __tablename__ = 'jobs'
+
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+                      db.Index('uq_jobs_key', 'key', unique=True))
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    # name of the handler that runs the job
+    kind = db.Column(db.String(50), nullable=False)
+
+    payload = db.Column(db.JSON, nullable=False)
+
+    # identifies the work, so the same work is only queued once (e.g. a webhook delivered twice)
+    key = db.Column(db.Text)
+
+    # how far the job got, for jobs that can carry on where a failed attempt stopped
+    progress = db.Column(db.Integer, nullable=False, default=0)
+
+    status = db.Column(db.Enum(JobStatus), nullable=False, default=JobStatus.queued)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+
+    # not run before this time, pushed back after a failed attempt
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    started_at = db.Column(db.DateTime)
+
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<Job id={self.id} kind={self.kind} status={self.status}>"
@@ -0,0 +1,69 @@
+import base64
+import binascii
+import json
+
+from sqlalchemy import tuple_, asc
+from models import Contact
+
+##############################################################################
+# Keyset pagination for contact lists
+#
+# Pages are ordered by (primary_last_name, id) and each page starts right after the last row of the previous page,
+# so fetching a page costs the same no matter how deep into the list it is. The position is handed to the client
+# as an opaque cursor string.
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """ raised when a cursor sent by a client can't be decoded"""
+
+
+class InvalidLimit(ValueError):
+    """ raised when a client asks for pages of no contacts or less"""
+
+
+def encode_cursor(contact):
+    """ turn the position of a contact in the list into an opaque, url safe cursor"""
+
+    position = json.dumps([contact.primary_last_name, contact.id])
+
+    return base64.urlsafe_b64encode(position.encode('utf8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """ turn a cursor back into a (primary_last_name, id) position"""
+
+    try:
+        last_name, contact_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(last_name, str) or not isinstance(contact_id, int):
+        raise InvalidCursor(cursor)
+
+    return last_name, contact_id
+
+
+def paginate_contacts(query, limit, cursor=None):
+    """ return (contacts, next_cursor) for one page of a Contact query.
+
+    next_cursor is None on the last page. Pages are at most MAX_PAGE_SIZE long, a limit under 1 raises InvalidLimit.
+    """
+
+    if limit < 1:
+        raise InvalidLimit(limit)
+    limit = min(limit, MAX_PAGE_SIZE)
+    key = tuple_(Contact.primary_last_name, Contact.id)
+
+    if cursor:
+        query = query.filter(key > tuple_(*decode_cursor(cursor)))
+
+    ## fetch one extra row to find out if there is another page
+    contacts = query.order_by(asc(Contact.primary_last_name), asc(Contact.id)).limit(limit + 1).all()
+
+    if len(contacts) > limit:
+        contacts = contacts[:limit]
+        return contacts, encode_cursor(contacts[-1])
+
+    return contacts, None
@@ -0,0 +1,143 @@
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from threading import Lock
+
+import bcrypt
+
+##############################################################################
+# Hashing and checking passwords
+#
+# bcrypt is slow on purpose, a hash takes a few hundred ms of CPU at the default cost. It runs on a small pool of
+# processes of its own instead of in the web worker. The web worker still waits for it, so only MAX_PASSWORD_JOBS
+# hashes may be running or waiting at once across all the web workers: the semaphore counting them is made in the
+# gunicorn master (see gunicorn.conf.py) and shared by the workers forked from it. A burst of logins past that is
+# turned away at once with PasswordBusy instead of taking over the workers and the CPU. The cost is set by
+# BCRYPT_ROUNDS, and a stored hash made with another cost is made again at the user's next login (see
+# User.authenticate).
+
+# bcrypt cost, each round more doubles the time a hash takes
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+# processes hashing passwords, in each web worker
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', 1))
+
+# most hashes and checks running or waiting at once, in all the web workers together. More than that raise
+# PasswordBusy. Keep it below the number of web workers, so some are always free for other requests
+MAX_PASSWORD_JOBS = int(os.environ.get('MAX_PASSWORD_JOBS', 2))
+
+# seconds to wait for a hash
+PASSWORD_TIMEOUT = 10
+
+pool = None
+pool_pid = None
+pool_lock = Lock()
+# hashes running or waiting, shared with the processes forked after it was made (see share_slots)
+slots = multiprocessing.BoundedSemaphore(MAX_PASSWORD_JOBS)
+
+# hash of a random password, checked for logins with an unknown email (see check_dummy_password)
+dummy_hash = None
+
+
+def share_slots():
+    """ make the semaphore counting the hashes anew. Called in the gunicorn master, so that every worker forked
+    after it counts against the same MAX_PASSWORD_JOBS"""
+
+    global slots
+
+    slots = multiprocessing.BoundedSemaphore(MAX_PASSWORD_JOBS)
+
+
+class PasswordBusy(Exception):
+    """ raised when too many passwords are being hashed already"""
+
+
+def get_pool():
+    """ the process pool, made on first use in each process (a pool doesn't survive a fork, gunicorn forks the
+    workers from the master)"""
+
+    global pool, pool_pid
+
+    with pool_lock:
+        if pool is None or pool_pid != os.getpid():
+            pool = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS)
+            pool_pid = os.getpid()
+
+    return pool
+
+
+def run(function, *args):
+    """ call function(*args) on the pool and return its result. Raises PasswordBusy if the pool is full up, or if
+    the result takes longer than PASSWORD_TIMEOUT"""
+
+    global pool
+
+    if not slots.acquire(False):
+        raise PasswordBusy()
+
+    try:
+        future = get_pool().submit(function, *args)
+    except BrokenProcessPool:
+        ## a pool process died, the next call gets a new pool
+        pool = None
+        slots.release()
+        raise
+
+    ## the slot is taken until the pool is done with the job, not until we stop waiting for it, so jobs given up on
+    ## still count against MAX_PASSWORD_JOBS
+    future.add_done_callback(lambda future: slots.release())
+
+    try:
+        return future.result(timeout=PASSWORD_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        raise PasswordBusy()
+    except BrokenProcessPool:
+        pool = None
+        raise
+
+
+def bcrypt_hash(password, rounds):
+    """ bcrypt hash of a password, as text (run on the pool)"""
+
+    return bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt(rounds)).decode('utf8')
+
+
+def bcrypt_check(hashed, password):
+    """ whether the password matches the bcrypt hash (run on the pool)"""
+
+    return bcrypt.checkpw(password.encode('utf8'), hashed.encode('utf8'))
+
+
+def hash_password(password):
+    """ hash of a password, made with the cost of BCRYPT_ROUNDS"""
+
+    return run(bcrypt_hash, password, BCRYPT_ROUNDS)
+
+
+def check_password(hashed, password):
+    """ whether the password matches a stored hash"""
+
+    return run(bcrypt_check, hashed, password)
+
+
+def needs_rehash(hashed):
+    """ whether a stored hash was made with another cost than BCRYPT_ROUNDS. Hashes look like $2b$12$..."""
+
+    return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+
+
+def check_dummy_password(password):
+    """ check a password against a hash no password matches, so a login with an unknown email takes as long as
+    one with a wrong password. Always False"""
+
+    global dummy_hash
+
+    if dummy_hash is None or needs_rehash(dummy_hash):
+        dummy_hash = hash_password(secrets.token_urlsafe(32))
+
+    check_password(dummy_hash, password)
+
+    return False
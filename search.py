@@ -0,0 +1,120 @@
+import re
+
+from sqlalchemy import event, DDL, func, desc, asc, text
+from sqlalchemy.sql import table, column
+from models import db, Contact
+
+##############################################################################
+# Contact search index
+#
+# Contact.search_document is a generated column holding a lower cased copy of every searchable field.
+# On postgres it is indexed twice: a full text (tsvector) index for ranked word prefix matches, and a
+# pg_trgm index so that '%term%' substring matches on it can use an index too.
+# On sqlite (local development) an fts5 table kept in sync with triggers plays the same role.
+
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_contacts_search_tsv ON contacts USING gin (to_tsvector('simple', search_document))",
+    "CREATE INDEX IF NOT EXISTS ix_contacts_search_trgm ON contacts USING gin (search_document gin_trgm_ops)",
+]
+
+SQLITE_DDL = [
+    "DROP TABLE IF EXISTS contacts_fts",
+    "CREATE VIRTUAL TABLE contacts_fts USING fts5(search_document, content='contacts', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN
+        INSERT INTO contacts_fts(rowid, search_document) VALUES (new.id, new.search_document);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN
+        INSERT INTO contacts_fts(contacts_fts, rowid, search_document) VALUES ('delete', old.id, old.search_document);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN
+        INSERT INTO contacts_fts(contacts_fts, rowid, search_document) VALUES ('delete', old.id, old.search_document);
+        INSERT INTO contacts_fts(rowid, search_document) VALUES (new.id, new.search_document);
+    END""",
+]
+
+# create the search indexes whenever the contacts table is created (db.create_all)
+for statement in POSTGRES_DDL:
+    event.listen(Contact.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+for statement in SQLITE_DDL:
+    event.listen(Contact.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+event.listen(Contact.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect='sqlite'))
+
+contacts_fts = table('contacts_fts', column('rowid'), column('rank'), column('search_document'))
+
+
+def search_words(term):
+    """ split a search term into the lower cased words used to query the index"""
+
+    return re.findall(r'\w+', term.lower())
+
+
+def search_contacts(query, term, ranked=True):
+    """ filter a Contact query down to the contacts matching the search term, best matches first.
+
+    Every word in the term has to match the start of a word in the contact (so 'jo sm' finds 'John Smith').
+    On postgres any contact containing the whole term is also matched, like the old ilike search did.
+    Pass ranked=False to only filter, e.g. when the caller pages through the results in its own order.
+    """
+
+    words = search_words(term)
+    dialect = db.engine.dialect.name
+
+    if words and dialect == 'postgresql':
+        document = func.to_tsvector('simple', Contact.search_document)
+        ts_query = func.to_tsquery('simple', ' & '.join(f"{word}:*" for word in words))
+        contains = Contact.search_document.ilike(f'%{term.lower()}%')
+        rank = desc(func.ts_rank(document, ts_query) + func.word_similarity(term.lower(), Contact.search_document))
+
+        query = query.filter(db.or_(document.op('@@')(ts_query), contains))
+
+    elif words and dialect == 'sqlite':
+        fts_query = ' '.join(f'"{word}"*' for word in words)
+        rank = asc(contacts_fts.c.rank)
+
+        query = (query.join(contacts_fts, contacts_fts.c.rowid == Contact.id)
+                 .filter(contacts_fts.c.search_document.op('MATCH')(fts_query)))
+
+    else:
+        ## no usable words (only punctuation) or an unknown database: fall back on a plain substring match
+        rank = None
+
+        query = query.filter(Contact.search_document.ilike(f'%{term.lower()}%'))
+
+    if not ranked:
+        return query
+    if rank is None:
+        return query.order_by(asc(Contact.primary_last_name))
+
+    return query.order_by(rank, asc(Contact.primary_last_name))
+
+
+def rebuild_search_index():
+    """ add the search column and indexes to an existing contacts table and (re)fill them.
+
+    Run through migrate.py against a database created before contact search was added.
+    """
+
+    dialect = db.engine.dialect.name
+    expression = Contact.__table__.c.search_document.computed.sqltext
+
+    if dialect == 'postgresql':
+        db.session.execute(text(f"ALTER TABLE contacts ADD COLUMN IF NOT EXISTS search_document TEXT "
+                                f"GENERATED ALWAYS AS ({expression}) STORED"))
+        for statement in POSTGRES_DDL:
+            db.session.execute(text(statement))
+
+    elif dialect == 'sqlite':
+        ## sqlite can only add generated columns as virtual ones (table_xinfo also lists generated columns)
+        columns = [row[1] for row in db.session.execute(text("PRAGMA table_xinfo(contacts)"))]
+        if 'search_document' not in columns:
+            db.session.execute(text(f"ALTER TABLE contacts ADD COLUMN search_document TEXT "
+                                    f"GENERATED ALWAYS AS ({expression}) VIRTUAL"))
+        for statement in SQLITE_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')"))
+
+    db.session.commit()
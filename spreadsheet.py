@@ -0,0 +1,89 @@
+import csv
+import math
+from io import BytesIO, TextIOWrapper
+
+##############################################################################
+# Reading uploaded spreadsheets
+#
+# Rows are read one at a time and handed out as dicts keyed by the header row, so an import never holds more than
+# the raw file and the rows of the chunk being written (see importer.py). xlsx files are read with openpyxl in
+# read only mode, csv files with the csv module. Old .xls files can't be read row by row, they still go through
+# pandas.
+
+XLSX_SIGNATURE = b'PK\x03\x04'
+XLS_SIGNATURE = b'\xd0\xcf\x11\xe0'
+
+
+def cell_value(value):
+    """ a cell as a python value, empty cells (blank, nan, NaT) as None"""
+
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    if hasattr(value, 'to_pydatetime'):
+        ## pandas Timestamp. NaT isn't equal to itself
+        return None if value != value else value.to_pydatetime()
+
+    return value
+
+
+def rows_to_dicts(rows):
+    """ turn an iterator of row tuples, the first one the header, into dicts. Empty rows come out as empty dicts,
+    so rows keep their numbers"""
+
+    rows = iter(rows)
+    header = [cell_value(name) for name in next(rows, [])]
+
+    for row in rows:
+        values = [cell_value(value) for value in row]
+        yield {name: value for (name, value) in zip(header, values) if name is not None and value is not None}
+
+
+def xlsx_rows(file):
+    """ rows of the first sheet of an xlsx file"""
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def csv_rows(file):
+    """ rows of a csv file"""
+
+    yield from csv.reader(TextIOWrapper(file, encoding='utf-8-sig', errors='replace', newline=''))
+
+
+def xls_rows(file):
+    """ rows of the first sheet of an old .xls file. These are read whole by pandas"""
+
+    import pandas as pd
+
+    df = pd.read_excel(file, header=None, dtype=object)
+
+    yield from df.itertuples(index=False, name=None)
+
+
+def read_rows(content):
+    """ yields the rows of a spreadsheet (xlsx, xls or csv, as bytes or a binary file) as dicts keyed by the header
+    row, with empty cells as None"""
+
+    file = BytesIO(content) if isinstance(content, bytes) else content
+    signature = file.read(4)
+    file.seek(0)
+
+    if signature == XLSX_SIGNATURE:
+        rows = xlsx_rows(file)
+    elif signature == XLS_SIGNATURE:
+        rows = xls_rows(file)
+    else:
+        rows = csv_rows(file)
+
+    return rows_to_dicts(rows)
@@ -8,18 +8,31 @@ $(document).ready(function() {
 
 	console.log(user_id);
 
+	/** contacts are loaded one page at a time. next_cursor points at the next page, null when there is none. */
+	const page_size = 60;
+	let next_cursor = null;
+	let current_search = undefined;
+	let loading = false;
+
+	/** counts the searches, so that a slow response for an old search doesn't overwrite a newer one */
+	let search_count = 0;
+
 	/** call show_contacts withouth a search argument so show all contacts immediately.  */
 	show_contacts(user_id);
 
-	/** function for retrieving contacts from api through ajax. 
-     * takes a search argument in case the results need to be filtered. 
+	/** function for retrieving a page of contacts from api through ajax. 
+     * takes a search argument in case the results need to be filtered, and the cursor of the page to get. 
+     * Search results come back all at once, best matches first, since pages would lose the ranking. Only the
+     * full list is paged.
      */
-	async function get_contacts(id, search = undefined) {
+	async function get_contacts(id, search = undefined, cursor = undefined) {
 		console.log('get contacts');
 		const response = await axios.get('/api/contacts', {
 			params : {
 				search     : search,
-				contact_id : id
+				contact_id : id,
+				limit      : search ? undefined : page_size,
+				cursor     : cursor
 			}
 		});
 
@@ -45,17 +58,81 @@ $(document).ready(function() {
 		e.preventDefault();
 	});
 
-	/** function for displaying contacts. calls the get_contact fuction to retrieve data. 
+	/** function for displaying contacts. calls the get_contact fuction to retrieve the first page. 
      * Takes a search argument in case results need to be filtered.
     */
 
 	async function show_contacts(id, search = undefined) {
-		response = await get_contacts(id, search);
+		const count = ++search_count;
+		current_search = search;
+		loading = true;
+
+		let response;
+		try {
+			response = await get_contacts(id, search);
+		} finally {
+			/** a newer search has taken over loading, leave it to that one */
+			if (count === search_count) {
+				loading = false;
+			}
+		}
+
+		if (count !== search_count) {
+			return;
+		}
 
 		console.log('show contacts');
 		$('#contact-list').empty();
 
-		for (contact of response.data.contacts) {
+		add_contacts(response.data);
+		load_while_visible(id);
+	}
+
+	/** function for appending the next page of contacts when the user scrolls to the end of the list */
+
+	async function show_more_contacts(id) {
+		if (loading || !next_cursor) {
+			return;
+		}
+
+		const count = search_count;
+		loading = true;
+
+		let response;
+		try {
+			response = await get_contacts(id, current_search, next_cursor);
+		} finally {
+			if (count === search_count) {
+				loading = false;
+			}
+		}
+
+		if (count !== search_count) {
+			return;
+		}
+
+		add_contacts(response.data);
+		load_while_visible(id);
+	}
+
+	/** the observer only fires when the end of the list comes into view. If a page didn't fill the screen the end
+     * is still in view, so get the next page straight away
+     */
+
+	function load_while_visible(id) {
+		const end = $('#contact-list-end')[0];
+
+		if (end && next_cursor && end.getBoundingClientRect().top < window.innerHeight) {
+			show_more_contacts(id);
+		}
+	}
+
+	/** function for adding a page of contacts to the list and remembering where the next page starts */
+
+	function add_contacts(data) {
+		next_cursor = data.next_cursor || null;
+
+		for (contact of data.contacts) {
 			$('#contact-list').append(
 				`<div class="col mb-4">
                 <div class="card h-100 profile_view d-flex flex-column justfify-content-between">
@@ -108,6 +185,16 @@ $(document).ready(function() {
 		}
 	}
 
+	/** load the next page once the end of the list scrolls into view */
+	if ($('#contact-list-end').length && 'IntersectionObserver' in window) {
+		const observer = new IntersectionObserver(function(entries) {
+			if (entries[0].isIntersecting) {
+				show_more_contacts(user_id);
+			}
+		});
+		observer.observe($('#contact-list-end')[0]);
+	}
+
 	/**  *************************** */
 	// This is the beginning of the Contact modal code.  This is supposed to pass on the id of contact
 	/** ************************** */
@@ -0,0 +1,565 @@
+"""Contact View tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_contact_views.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Contact, UserContact, Tag
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///jane-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY, contacts_etag
+
+app.config['SQLALCHEMY_ECHO'] = False
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+db.drop_all()
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class QueryCounter:
+    """Counts the SQL statements sent to the database while active."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self._count)
+
+
+class ContactApiTestCase(TestCase):
+    """Test the contacts api."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        UserContact.query.delete()
+        Contact.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        self.testuser = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        self.otheruser = User.register('other@test.com', 'password', 'otheruser', "lastname")
+
+        self.testuser.contacts.append(Contact(primary_first_name='bob', primary_last_name='smith', city='Seattle', zip_code='98101', notes='bob prefers texts'))
+        self.testuser.contacts.append(Contact(primary_first_name='ann', primary_last_name='jones', city='Tacoma', notes='met bob at open house'))
+        self.testuser.contacts.append(Contact(primary_first_name='joe', primary_last_name='hidden', is_visible=False))
+
+        db.session.add_all([self.testuser, self.otheruser])
+        db.session.commit()
+
+        self.testuser_id = self.testuser.id
+        self.otheruser_id = self.otheruser.id
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+
+    def add_other_contacts(self, count):
+        """ fill the table with contacts that belong to another user"""
+
+        other = User.query.get(self.otheruser_id)
+        for i in range(count):
+            other.contacts.append(Contact(primary_first_name=f'other{i}', primary_last_name='smith', city='Seattle'))
+        db.session.commit()
+
+    def get_contacts(self, search=None, **params):
+        """ call the contacts api for the test user and return the response"""
+
+        return self.client.get('/api/contacts', query_string={'contact_id': self.testuser_id, 'search': search, **params})
+
+    def test_list_contacts(self):
+        """ only the user's visible contacts are returned, sorted by last name"""
+
+        self.add_other_contacts(3)
+        resp = self.get_contacts()
+
+        self.assertEqual(resp.status_code, 200)
+        names = [c['primary_last_name'] for c in resp.json['contacts']]
+        self.assertEqual(names, ['jones', 'smith'])
+
+    def test_search_contacts(self):
+        """ search only matches within the user's contacts"""
+
+        self.add_other_contacts(3)
+        resp = self.get_contacts('seattle')
+
+        self.assertEqual(resp.status_code, 200)
+        names = [c['primary_first_name'] for c in resp.json['contacts']]
+        self.assertEqual(names, ['bob'])
+
+    def test_search_prefix(self):
+        """ every word in the search matches the start of a word in the contact"""
+
+        resp = self.get_contacts('Bo Smi')
+        names = [c['primary_first_name'] for c in resp.json['contacts']]
+        self.assertEqual(names, ['bob'])
+
+        resp = self.get_contacts('seat')
+        names = [c['primary_first_name'] for c in resp.json['contacts']]
+        self.assertEqual(names, ['bob'])
+
+    def test_search_zip_code(self):
+        """ zip codes are searchable"""
+
+        resp = self.get_contacts('98101')
+        names = [c['primary_first_name'] for c in resp.json['contacts']]
+        self.assertEqual(names, ['bob'])
+
+    def test_search_ranking(self):
+        """ better matches come first"""
+
+        resp = self.get_contacts('bob')
+        names = [c['primary_first_name'] for c in resp.json['contacts']]
+        self.assertEqual(names, ['bob', 'ann'])
+
+    def test_pages(self):
+        """ paging through the contacts returns every contact once, in order"""
+
+        user = User.query.get(self.testuser_id)
+        for i in range(4):
+            user.contacts.append(Contact(primary_first_name=f'page{i}', primary_last_name='jones'))
+        db.session.commit()
+
+        names = []
+        cursor = None
+        while True:
+            resp = self.get_contacts(limit=2, cursor=cursor)
+            self.assertEqual(resp.status_code, 200)
+            self.assertLessEqual(len(resp.json['contacts']), 2)
+            names.extend(c['primary_first_name'] for c in resp.json['contacts'])
+            cursor = resp.json['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(names, ['ann', 'page0', 'page1', 'page2', 'page3', 'bob'])
+
+    def test_pages_search(self):
+        """ searching while paging filters the pages"""
+
+        resp = self.get_contacts('seattle', limit=1)
+        self.assertEqual([c['primary_first_name'] for c in resp.json['contacts']], ['bob'])
+        self.assertIsNone(resp.json['next_cursor'])
+
+    def test_bad_cursor(self):
+        """ a cursor that can't be decoded is a bad request"""
+
+        resp = self.get_contacts(limit=2, cursor='not-a-cursor')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_bad_limit(self):
+        """ a page of no contacts or less is a bad request too"""
+
+        for limit in [0, -3]:
+            resp = self.get_contacts(limit=limit)
+            self.assertEqual(resp.status_code, 400)
+
+    def test_list_contacts_query_count(self):
+        """ the number of queries doesn't grow with the size of the contacts table"""
+
+        self.add_other_contacts(5)
+        with QueryCounter() as small:
+            self.get_contacts()
+
+        self.add_other_contacts(50)
+        with QueryCounter() as large:
+            self.get_contacts()
+
+        self.assertEqual(small.count, large.count)
+
+    def test_list_contacts_query_count_tags(self):
+        """ the number of queries doesn't grow with the number of the user's contacts or their tags"""
+
+        def add_tagged_contacts(count):
+            user = User.query.get(self.testuser_id)
+            for i in range(count):
+                user.contacts.append(Contact(primary_first_name=f'tagged{i}', primary_last_name='lee', tags=[Tag(name='vip')]))
+            db.session.commit()
+
+        add_tagged_contacts(2)
+        with QueryCounter() as small:
+            resp = self.get_contacts()
+        tags = {c['primary_first_name']: c['tags'] for c in resp.json['contacts']}
+        self.assertEqual(tags['tagged0'], ['vip'])
+        self.assertEqual(tags['ann'], 'None')
+
+        add_tagged_contacts(20)
+        with QueryCounter() as large:
+            self.get_contacts()
+
+        self.assertEqual(small.count, large.count)
+
+
+class ContactChangesApiTestCase(TestCase):
+    """Test the contact changes api."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        UserContact.query.delete()
+        Contact.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        testuser = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        testuser.contacts.append(Contact(primary_first_name='bob', primary_last_name='smith'))
+        testuser.contacts.append(Contact(primary_first_name='ann', primary_last_name='jones'))
+        db.session.add(testuser)
+        db.session.commit()
+
+        self.testuser_id = testuser.id
+        self.bob_id, self.ann_id = [c.id for c in testuser.contacts]
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+
+    def get_changes(self, since=None):
+        """ call the changes api for the test user and return the json"""
+
+        resp = self.client.get('/api/contacts/changes', query_string={'contact_id': self.testuser_id, 'since': since})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json
+
+    def test_changes_other_users(self):
+        """ only the logged in user's own changes can be read"""
+
+        other = User.register('other@test.com', 'password', 'otheruser', "lastname")
+        db.session.add(other)
+        db.session.commit()
+
+        resp = self.client.get('/api/contacts/changes', query_string={'contact_id': other.id})
+        self.assertEqual(resp.status_code, 403)
+
+        with self.client.session_transaction() as sess:
+            del sess[CURR_USER_KEY]
+        resp = self.client.get('/api/contacts/changes', query_string={'contact_id': self.testuser_id})
+        self.assertEqual(resp.status_code, 401)
+
+    def test_changes(self):
+        """ only contacts added, edited or deleted since the last sync come back"""
+
+        first = self.get_changes()
+        self.assertEqual(sorted(c['primary_first_name'] for c in first['contacts']), ['ann', 'bob'])
+
+        # nothing changed yet
+        unchanged = self.get_changes(first['seq'])
+        self.assertEqual(unchanged['contacts'], [])
+        self.assertEqual(unchanged['deleted'], [])
+        self.assertEqual(unchanged['seq'], first['seq'])
+
+        self.client.post(f'/contacts/{self.bob_id}/edit', data={'primary_first_name': 'robert', 'primary_last_name': 'smith',
+                                                                  'status': 'Inactive', 'mail_preference': 'All'})
+        self.client.post(f'/contacts/{self.ann_id}/delete')
+        self.client.post(f'/users/{self.testuser_id}/contacts', data={'primary_first_name': 'cat', 'primary_last_name': 'lee',
+                                                                      'status': 'Inactive', 'mail_preference': 'All'})
+
+        changes = self.get_changes(first['seq'])
+        self.assertEqual([c['primary_first_name'] for c in changes['contacts']], ['robert', 'cat'])
+        self.assertEqual(changes['deleted'], [self.ann_id])
+        self.assertGreater(changes['seq'], first['seq'])
+
+        self.assertEqual(self.get_changes(changes['seq'])['contacts'], [])
+
+
+class ContactEtagTestCase(TestCase):
+    """Test conditional requests for contacts."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        UserContact.query.delete()
+        Contact.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        testuser = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        testuser.contacts.append(Contact(primary_first_name='bob', primary_last_name='smith'))
+        db.session.add(testuser)
+        db.session.commit()
+
+        self.testuser_id = testuser.id
+        self.bob_id = testuser.contacts[0].id
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+
+    def test_api_not_modified(self):
+        """ an unchanged contact list is answered with a 304 without loading anything"""
+
+        query = {'contact_id': self.testuser_id}
+        resp = self.client.get('/api/contacts', query_string=query)
+        etag = resp.headers['ETag']
+
+        with QueryCounter() as counter:
+            resp = self.client.get('/api/contacts', query_string=query, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(counter.count, 1)
+
+        # a different search is a different response
+        resp = self.client.get('/api/contacts', query_string={**query, 'search': 'bob'}, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_api_modified(self):
+        """ changing a contact changes the ETag"""
+
+        query = {'contact_id': self.testuser_id}
+        etag = self.client.get('/api/contacts', query_string=query).headers['ETag']
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+        self.client.post(f'/contacts/{self.bob_id}/delete')
+
+        resp = self.client.get('/api/contacts', query_string=query, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json['contacts'], [])
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_details_not_modified(self):
+        """ the contact details page is answered with a 304 while the contact doesn't change"""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+        resp = self.client.get(f'/contacts/{self.bob_id}')
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.get(f'/contacts/{self.bob_id}', headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(resp.status_code, 304)
+
+
+class ContactOwnershipTestCase(TestCase):
+    """Test that users only get to their own contacts."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        UserContact.query.delete()
+        Contact.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        testuser = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        otheruser = User.register('other@test.com', 'password', 'otheruser', "lastname")
+        testuser.contacts.append(Contact(primary_first_name='bob', primary_last_name='smith'))
+        otheruser.contacts.append(Contact(primary_first_name='ann', primary_last_name='jones'))
+        db.session.add_all([testuser, otheruser])
+        db.session.commit()
+
+        self.testuser_id = testuser.id
+        self.bob_id = testuser.contacts[0].id
+        self.ann_id = otheruser.contacts[0].id
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+
+    def test_own_contact(self):
+        """ the user's own contact can be seen"""
+
+        resp = self.client.get(f'/contacts/{self.bob_id}')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('bob', resp.get_data(as_text=True))
+
+    def test_other_users_contact(self):
+        """ another user's contact can't be seen, edited or deleted"""
+
+        self.assertEqual(self.client.get(f'/contacts/{self.ann_id}').status_code, 302)
+        self.assertEqual(self.client.get(f'/contacts/{self.ann_id}/edit').status_code, 302)
+        self.assertEqual(self.client.post(f'/contacts/{self.ann_id}/delete').status_code, 302)
+        self.assertTrue(Contact.query.get(self.ann_id).is_visible)
+
+    def test_other_users_contact_etag(self):
+        """ an ETag doesn't get a 304 for another user's contact, or for one that doesn't exist"""
+
+        for contact_id in [self.ann_id, self.ann_id + self.bob_id + 1]:
+            with app.test_request_context():
+                etag = contacts_etag(self.testuser_id, contact_id, 'testuser1')
+            resp = self.client.get(f'/contacts/{contact_id}', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 302 if contact_id == self.ann_id else 404)
+
+    def test_ownership_query_count(self):
+        """ checking ownership doesn't load the user's contacts"""
+
+        with QueryCounter() as small:
+            self.client.get(f'/contacts/{self.bob_id}')
+
+        user = User.query.get(self.testuser_id)
+        for i in range(30):
+            user.contacts.append(Contact(primary_first_name=f'more{i}', primary_last_name='lee'))
+        db.session.commit()
+
+        with QueryCounter() as large:
+            self.client.get(f'/contacts/{self.bob_id}')
+
+        self.assertEqual(small.count, large.count)
+
+    def test_unique_link(self):
+        """ a contact can only be linked to a user once"""
+
+        db.session.add(UserContact(user_id=self.testuser_id, contact_id=self.bob_id))
+        self.assertRaises(IntegrityError, db.session.commit)
+
+
+class ContactDedupeTestCase(TestCase):
+    """Test that adding a contact the user already has doesn't make a copy."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        UserContact.query.delete()
+        Contact.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        testuser = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        testuser.contacts.append(Contact(primary_first_name='Bob', primary_last_name='Smith', primary_phone='(206) 555-0100'))
+        db.session.add(testuser)
+        db.session.commit()
+
+        self.testuser_id = testuser.id
+        self.bob_id = testuser.contacts[0].id
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+
+    def test_add_duplicate(self):
+        """ the new details are merged into the contact the user already has"""
+
+        resp = self.client.post(f'/users/{self.testuser_id}/contacts', data={
+            'primary_first_name': ' bob', 'primary_last_name': 'SMITH', 'primary_phone': '206-555-0100',
+            'city': 'Seattle', 'status': 'Inactive', 'mail_preference': 'All'})
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertTrue(resp.location.endswith(f'/contacts/{self.bob_id}'))
+        self.assertEqual(Contact.query.count(), 1)
+        self.assertEqual(Contact.query.get(self.bob_id).city, 'Seattle')
+
+    def test_add_new(self):
+        """ a contact that only shares a name is still added"""
+
+        self.client.post(f'/users/{self.testuser_id}/contacts', data={
+            'primary_first_name': 'bob', 'primary_last_name': 'smith', 'primary_phone': '206-555-0199',
+            'status': 'Inactive', 'mail_preference': 'All'})
+
+        self.assertEqual(Contact.query.count(), 2)
+
+
+class ContactLookupTestCase(TestCase):
+    """Test looking up contacts by phone number."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        UserContact.query.delete()
+        Contact.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        testuser = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        otheruser = User.register('other@test.com', 'password', 'otheruser', "lastname")
+        testuser.contacts.append(Contact(primary_first_name='bob', primary_last_name='smith', primary_phone='(206) 555-0100'))
+        testuser.contacts.append(Contact(primary_first_name='ann', primary_last_name='jones', secondary_phone='206.555.0100'))
+        testuser.contacts.append(Contact(primary_first_name='joe', primary_last_name='hidden', primary_phone='2065550100', is_visible=False))
+        otheruser.contacts.append(Contact(primary_first_name='sam', primary_last_name='other', primary_phone='206-555-0100'))
+        db.session.add_all([testuser, otheruser])
+        db.session.commit()
+
+        self.testuser_id = testuser.id
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+    def test_lookup(self):
+        """ a number in any format finds the user's visible contacts with it as either phone"""
+
+        self.login()
+
+        for phone in ['+12065550100', '206 555 0100', '1-206-555-0100']:
+            resp = self.client.get('/api/lookup', query_string={'phone': phone})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json['phone'], '+12065550100')
+            self.assertEqual([c['primary_first_name'] for c in resp.json['contacts']], ['bob', 'ann'])
+
+    def test_lookup_no_match(self):
+        """ an unknown number finds nothing, something that isn't a number is a bad request"""
+
+        self.login()
+
+        resp = self.client.get('/api/lookup', query_string={'phone': '206-555-0199'})
+        self.assertEqual(resp.json['contacts'], [])
+
+        resp = self.client.get('/api/lookup', query_string={'phone': 'bob'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_lookup_logged_out(self):
+        """ only logged in users can look numbers up"""
+
+        resp = self.client.get('/api/lookup', query_string={'phone': '206-555-0100'})
+        self.assertEqual(resp.status_code, 401)
+
+    def test_phone_key_updated(self):
+        """ the key follows changes to the phone"""
+
+        contact = Contact.query.filter_by(primary_first_name='bob').one()
+        contact.primary_phone = '(425) 555-0100'
+        db.session.commit()
+
+        self.assertEqual(Contact.query.filter_by(primary_first_name='bob').one().primary_phone_key, '+14255550100')
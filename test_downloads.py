@@ -0,0 +1,125 @@
+"""File download tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_downloads.py
+
+
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from unittest import TestCase
+from urllib.parse import urlparse, parse_qs
+
+import downloads
+from downloads import download, download_all, DownloadError
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Serves /file?size=..&delay=..: size bytes after waiting delay seconds. chunked=1 leaves out Content-Length"""
+
+    def do_GET(self):
+        params = {key: values[0] for (key, values) in parse_qs(urlparse(self.path).query).items()}
+
+        if urlparse(self.path).path != '/file':
+            self.send_error(404)
+            return
+
+        time.sleep(float(params.get('delay', 0)))
+        size = int(params.get('size', 10))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if params.get('chunked'):
+            self.send_header('Connection', 'close')
+        else:
+            self.send_header('Content-Length', str(size))
+        self.end_headers()
+        self.wfile.write(b'x' * size)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTestCase(TestCase):
+    """Test downloading files from a local server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_download(self):
+        """ the file comes back rewound, in a temp file"""
+
+        with download(f'{self.base_url}/file?size=5000') as file:
+            self.assertEqual(file.read(), b'x' * 5000)
+
+    def test_download_all(self):
+        """ files are fetched at the same time, so it takes about as long as the slowest one"""
+
+        urls = {name: f'{self.base_url}/file?size=100&delay=0.5' for name in ['logo', 'headshot', 'bio']}
+
+        started = time.monotonic()
+        files = download_all(urls)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(set(files), set(urls))
+        self.assertLess(elapsed, 1.2)
+        for file in files.values():
+            self.assertEqual(file.read(), b'x' * 100)
+            file.close()
+
+    def test_download_too_large(self):
+        """ files over the size limit are refused, with or without a Content-Length"""
+
+        with self.assertRaises(DownloadError):
+            download(f'{self.base_url}/file?size=2000', max_size=1000)
+
+        with self.assertRaises(DownloadError):
+            download(f'{self.base_url}/file?size=200000&chunked=1', max_size=100000)
+
+    def test_download_timeout(self):
+        """ a server that doesn't answer in time is given up on"""
+
+        timeout = downloads.DOWNLOAD_TIMEOUT
+        downloads.DOWNLOAD_TIMEOUT = (1, 0.2)
+        try:
+            with self.assertRaises(DownloadError):
+                download(f'{self.base_url}/file?delay=1')
+        finally:
+            downloads.DOWNLOAD_TIMEOUT = timeout
+
+    def test_download_all_error(self):
+        """ one failed download fails them all"""
+
+        with self.assertRaises(DownloadError):
+            download_all({'logo': f'{self.base_url}/file', 'bio': f'{self.base_url}/missing'})
+
+    def test_download_all_other_error(self):
+        """ the files already fetched are closed whatever the error of a failed download"""
+
+        fetched = []
+
+        def fake_download(url):
+            if 'missing' in url:
+                raise OSError("no space left")
+            fetched.append(download(url))
+            return fetched[-1]
+
+        real_download = downloads.download
+        downloads.download = fake_download
+        try:
+            with self.assertRaises(OSError):
+                download_all({'logo': f'{self.base_url}/file', 'bio': f'{self.base_url}/missing'})
+        finally:
+            downloads.download = real_download
+
+        self.assertEqual(len(fetched), 1)
+        self.assertTrue(fetched[0].closed)
@@ -0,0 +1,366 @@
+"""Contact import tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_importer.py
+
+
+import os
+from datetime import datetime
+from io import BytesIO
+from unittest import TestCase
+
+from openpyxl import Workbook
+
+from sqlalchemy import event
+from werkzeug.datastructures import MultiDict
+
+from models import db, User, Contact, UserContact, MailOptions, Tag, ContactTag, Transaction, Stage, Task
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///jane-test"
+
+
+# Now we can import app
+
+from app import app
+from importer import import_contacts
+from spreadsheet import read_rows
+from dedupe import merge_duplicates
+from forms import PHONE_ERROR, ContactForm
+from validation import validate_rows, cached_phone
+from helper import get_contact_images, guess_gender
+from fake_data import add_fake_data, fake_contacts, fake_workbook, CONTACTS_PER_USER
+
+app.config['SQLALCHEMY_ECHO'] = False
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.drop_all()
+db.create_all()
+
+
+class ImportContactsTestCase(TestCase):
+    """Test importing spreadsheet rows as contacts."""
+
+    def setUp(self):
+        """Add a user to import contacts for."""
+
+        UserContact.query.delete()
+        Contact.query.delete()
+        User.query.delete()
+
+        user = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+
+    def test_import_contacts(self):
+        """ rows are imported in chunks and linked to the user"""
+
+        rows = [{'primary_first_name': f'first{i}', 'primary_last_name': f'last{i}', 'zip_code': 94501.0,
+                 'mail_preference': 'Holiday only', 'primary_DOB': datetime(1980, 1, 2), 'unknown_column': 'ignored'}
+                for i in range(7)]
+
+        result = import_contacts(self.user_id, rows, chunk_size=3)
+
+        self.assertEqual(result.imported, 7)
+        self.assertEqual(result.errors, [])
+
+        user = User.query.get(self.user_id)
+        self.assertEqual(len(user.contacts), 7)
+
+        contact = Contact.query.filter_by(primary_first_name='first0').one()
+        self.assertEqual(contact.zip_code, '94501')
+        self.assertEqual(contact.mail_preference, MailOptions.holiday)
+        self.assertEqual(contact.primary_DOB, datetime(1980, 1, 2))
+        self.assertTrue(contact.image_url)
+
+        ## one change per chunk, so clients syncing with /api/contacts/changes see the new contacts
+        self.assertEqual(user.contact_seq, 3)
+        self.assertEqual(max(link.change_seq for link in UserContact.query.filter_by(user_id=self.user_id)), 3)
+
+    def test_import_past_client(self):
+        """ the past client column is imported, from booleans and from the ways spreadsheets write yes and no"""
+
+        rows = [{'primary_first_name': f'first{i}', 'primary_last_name': 'past', 'past_client': value}
+                for (i, value) in enumerate([True, 'Yes', 1, False, 'no', None, 'maybe'])]
+
+        result = import_contacts(self.user_id, rows)
+
+        self.assertEqual(result.imported, 6)
+        self.assertEqual(result.errors, [(7, "past_client: Not a yes or no value")])
+        past_clients = {contact.primary_first_name: contact.past_client for contact in Contact.query}
+        self.assertEqual(past_clients, {'first0': True, 'first1': True, 'first2': True, 'first3': False,
+                                        'first4': False, 'first5': False})
+
+    def test_import_bad_rows(self):
+        """ bad rows are reported and skipped, the rest are still imported"""
+
+        rows = [
+            {'primary_first_name': 'bob', 'primary_last_name': 'smith'},
+            {'primary_first_name': 'no', 'primary_last_name': None},
+            {'primary_first_name': 'long', 'primary_last_name': 'email', 'primary_email': 'x' * 60},
+            {'primary_first_name': 'bad', 'primary_last_name': 'mail', 'mail_preference': 'Sometimes'},
+            {'primary_first_name': 'ann', 'primary_last_name': 'jones'},
+        ]
+
+        result = import_contacts(self.user_id, rows)
+
+        self.assertEqual(result.imported, 2)
+        self.assertEqual([number for (number, error) in result.errors], [2, 3, 4])
+
+        names = sorted(contact.primary_first_name for contact in User.query.get(self.user_id).contacts)
+        self.assertEqual(names, ['ann', 'bob'])
+
+
+    def test_import_duplicates(self):
+        """ rows that duplicate a contact or an earlier row are merged into it, without a lookup per row"""
+
+        user = User.query.get(self.user_id)
+        user.contacts.append(Contact(primary_first_name='Bob', primary_last_name='Smith', primary_email='bob@test.com'))
+        db.session.commit()
+
+        rows = [{'primary_first_name': f'first{i}', 'primary_last_name': 'last'} for i in range(40)]
+        rows[5] = {'primary_first_name': ' bob ', 'primary_last_name': 'SMITH', 'primary_email': 'Bob@Test.com', 'city': 'Seattle'}
+        rows[30] = {'primary_first_name': 'first1', 'primary_last_name': 'last', 'notes': 'second copy'}
+
+        selects = []
+        def count_selects(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith('SELECT'):
+                selects.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_selects)
+        try:
+            result = import_contacts(self.user_id, rows, chunk_size=20, policy='merge')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_selects)
+
+        self.assertEqual((result.imported, result.merged, result.skipped), (38, 2, 0))
+        ## a few for each of the two chunks (duplicate lookup, contact_seq, change tracking of merged contacts), none per row
+        self.assertLessEqual(len(selects), 8)
+
+        self.assertEqual(Contact.query.filter_by(primary_last_name='Smith').one().city, 'Seattle')
+        self.assertEqual(Contact.query.filter_by(primary_first_name='first1').one().notes, 'second copy')
+
+    def test_import_duplicates_policies(self):
+        """ with skip duplicates are left out, with keep they are added anyway"""
+
+        rows = [{'primary_first_name': 'bob', 'primary_last_name': 'smith'}] * 3
+
+        result = import_contacts(self.user_id, rows, policy='skip')
+        self.assertEqual((result.imported, result.merged, result.skipped), (1, 0, 2))
+
+        result = import_contacts(self.user_id, rows, policy='keep')
+        self.assertEqual(result.imported, 3)
+        self.assertEqual(Contact.query.count(), 4)
+
+    def test_merge_duplicates(self):
+        """ saved duplicates are merged into the oldest one, which gets their details and tags"""
+
+        user = User.query.get(self.user_id)
+        tag = Tag(name='buyer')
+        user.contacts.append(Contact(primary_first_name='bob', primary_last_name='smith'))
+        user.contacts.append(Contact(primary_first_name='Bob', primary_last_name='Smith', city='Seattle', tags=[tag]))
+        user.contacts.append(Contact(primary_first_name='ann', primary_last_name='jones'))
+        db.session.commit()
+
+        self.assertEqual(merge_duplicates(self.user_id), 1)
+
+        visible = Contact.query.filter_by(is_visible=True).order_by(Contact.id).all()
+        self.assertEqual([contact.primary_first_name for contact in visible], ['bob', 'ann'])
+        self.assertEqual(visible[0].city, 'Seattle')
+        self.assertEqual([tag.name for tag in visible[0].tags], ['buyer'])
+        self.assertEqual(merge_duplicates(self.user_id), 0)
+
+class ReadRowsTestCase(TestCase):
+    """Test reading spreadsheet rows."""
+
+    def test_read_csv(self):
+        """ csv rows come out as dicts keyed by the header, empty cells left out"""
+
+        content = b'primary_first_name,primary_last_name,zip_code\r\nbob,smith,98101\r\n,,\r\nann, jones ,\r\n'
+
+        rows = list(read_rows(content))
+
+        self.assertEqual(rows, [
+            {'primary_first_name': 'bob', 'primary_last_name': 'smith', 'zip_code': '98101'},
+            {},
+            {'primary_first_name': 'ann', 'primary_last_name': 'jones'},
+        ])
+
+    def test_read_xlsx(self):
+        """ xlsx rows are read lazily, dates stay dates"""
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['primary_first_name', 'primary_last_name', 'primary_DOB', None])
+        sheet.append(['bob', 'smith', datetime(1980, 1, 2), 'no header'])
+        sheet.append(['ann', None, None, None])
+        output = BytesIO()
+        workbook.save(output)
+
+        rows = read_rows(output.getvalue())
+
+        self.assertEqual(next(rows), {'primary_first_name': 'bob', 'primary_last_name': 'smith',
+                                      'primary_DOB': datetime(1980, 1, 2)})
+        self.assertEqual(list(rows), [{'primary_first_name': 'ann'}])
+
+    def test_import_csv(self):
+        """ rows read from a file can be imported as they are"""
+
+        UserContact.query.delete()
+        Contact.query.delete()
+        User.query.delete()
+        user = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        db.session.add(user)
+        db.session.commit()
+
+        content = b'primary_first_name,primary_last_name,primary_DOB,mail_preference\nbob,smith,01/02/1980,None\n\n'
+        result = import_contacts(user.id, read_rows(content))
+
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(result.errors, [])
+
+        contact = Contact.query.one()
+        self.assertEqual(contact.primary_DOB, datetime(1980, 1, 2))
+        self.assertEqual(contact.mail_preference, MailOptions.none)
+
+
+class ValidateRowsTestCase(TestCase):
+    """Test checking imported rows with the contact form's rules."""
+
+    def test_validate_rows(self):
+        """ good rows come back normalized, bad ones with the form's error message"""
+
+        rows = [
+            (1, {'primary_first_name': ' bob ', 'primary_last_name': 'smith', 'primary_phone': '206.555.0100',
+                 'primary_email': 'bob@test.com', 'zip_code': 98101.0, 'primary_DOB': '1980-01-02',
+                 'status': 'Buyer', 'extra': 'dropped'}),
+            (2, {'primary_first_name': 'ann', 'primary_last_name': 'jones', 'primary_phone': '555'}),
+            (3, {'primary_first_name': 'joe', 'primary_last_name': 'brown', 'secondary_email': 'not an email'}),
+            (4, {'primary_first_name': 'x' * 51, 'primary_last_name': 'long'}),
+            (5, {'primary_first_name': 'sam', 'primary_last_name': 'lee', 'secondary_DOB': 'someday'}),
+            (6, {'primary_first_name': 'kim', 'primary_last_name': 'wu', 'mail_preference': 'Weekly'}),
+            (7, {'primary_first_name': 'lou', 'primary_last_name': ''}),
+        ]
+
+        clean, errors = validate_rows(rows)
+
+        self.assertEqual([number for (number, values) in clean], [1])
+        values = clean[0][1]
+        self.assertEqual(values['primary_first_name'], 'bob')
+        self.assertEqual(values['primary_phone'], '(206) 555-0100')
+        self.assertEqual(values['zip_code'], '98101')
+        self.assertEqual(values['primary_DOB'], datetime(1980, 1, 2))
+        self.assertEqual(values['status'].value, 'Buyer')
+        self.assertNotIn('extra', values)
+
+        errors = dict(errors)
+        self.assertEqual(sorted(errors), [2, 3, 4, 5, 6, 7])
+        self.assertEqual(errors[2], f"primary_phone: {PHONE_ERROR}")
+        self.assertEqual(errors[3], "secondary_email: Invalid email address.")
+        self.assertEqual(errors[4], "primary_first_name: This input should be max 50 characters")
+        self.assertEqual(errors[7], "primary_last_name: this field is required")
+
+    def test_emails_checked_like_the_form(self):
+        """ emails are turned down exactly when the contact form would turn them down"""
+
+        emails = ['bob@test.com', 'a@b..com', 'a..b@c.com', 'a@-b.com', 'a,b@c.com']
+        rows = [(number, {'primary_first_name': 'bob', 'primary_last_name': 'smith', 'primary_email': email})
+                for (number, email) in enumerate(emails)]
+
+        clean, errors = validate_rows(rows)
+
+        self.assertEqual([number for (number, values) in clean], [0])
+        self.assertEqual(dict(errors), {number: "primary_email: Invalid email address." for number in range(1, 5)})
+        with app.test_request_context():
+            for email in emails:
+                form = ContactForm(formdata=MultiDict({'primary_email': email}), meta={'csrf': False})
+                form.validate()
+                self.assertEqual('primary_email' in form.errors, email != 'bob@test.com', email)
+
+    def test_phones_parsed_once(self):
+        """ a number that comes up again isn't parsed again"""
+
+        cached_phone.cache_clear()
+        rows = [(i, {'primary_first_name': f'first{i}', 'primary_last_name': 'last', 'primary_phone': '2065550100'})
+                for i in range(1, 51)]
+
+        clean, errors = validate_rows(rows)
+
+        self.assertEqual(len(clean), 50)
+        self.assertEqual(cached_phone.cache_info().misses, 1)
+
+
+class ContactImageTestCase(TestCase):
+    """Test picking avatars for contacts."""
+
+    def test_contact_images(self):
+        """ one image per name, in order, each distinct name only looked up once"""
+
+        guess_gender.cache_clear()
+        names = ['John', 'sarah', 'john ', 'Zzyzx'] * 10
+
+        images = get_contact_images(names)
+
+        self.assertEqual(len(images), 40)
+        self.assertIn('/male/', images[0])
+        self.assertIn('/female/', images[1])
+        self.assertIn('/male/', images[2])
+        self.assertIn('/andy/', images[3])
+        self.assertEqual(guess_gender.cache_info().misses, 3)
+
+
+class FakeDataTestCase(TestCase):
+    """Test the made up data of the benchmarks."""
+
+    def setUp(self):
+        self.clear()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.clear()
+
+    def clear(self):
+        for model in [Task, Stage, Transaction, ContactTag, Tag, UserContact, Contact, User]:
+            model.query.delete()
+        db.session.commit()
+
+    def test_fake_contacts(self):
+        """ made up contacts pass the import checks, and a seed always makes the same ones"""
+
+        contacts = fake_contacts(500, seed=1)
+        clean, failed = validate_rows(list(enumerate(contacts, start=1)))
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(clean), 500)
+        self.assertEqual(fake_contacts(500, seed=1), contacts)
+        self.assertNotEqual(fake_contacts(500, seed=2), contacts)
+
+        self.assertEqual(len(list(read_rows(fake_workbook(20)))), 20)
+
+    def test_add_fake_data(self):
+        """ contacts are split between users and come with tags and transactions"""
+
+        add_fake_data(0, CONTACTS_PER_USER + 500)
+
+        self.assertEqual(User.query.count(), 2)
+        self.assertEqual(Contact.query.count(), CONTACTS_PER_USER + 500)
+        self.assertEqual(len(User.query.filter_by(email='user1@example.com').one().contacts), 500)
+        self.assertGreater(ContactTag.query.count(), 0)
+        self.assertGreater(Transaction.query.count(), 0)
+        self.assertEqual(Stage.query.count(), Transaction.query.count() * 3)
+        self.assertEqual(Task.query.count(), Stage.query.count() * 2)
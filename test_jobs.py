@@ -0,0 +1,197 @@
+"""Background job tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_jobs.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase
+
+from models import db, User, Contact, UserContact, UserFile, Job, JobStatus
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///jane-test"
+
+
+# Now we can import app
+
+from app import app
+from jobs import JOB_HANDLERS, enqueue, claim_job, run_job, work
+
+app.config['SQLALCHEMY_ECHO'] = False
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+db.drop_all()
+db.create_all()
+
+
+def typeform_payload(*answers):
+    """ a typeform webhook body with these answers"""
+
+    return {'form_response': {'answers': [
+        {'field': {'ref': 'first_name'}, 'text': 'Test'},
+        {'field': {'ref': 'last_name'}, 'text': 'User'},
+        *answers,
+    ]}}
+
+
+class JobTestCase(TestCase):
+    """Test the job queue and the typeform webhook."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        Job.query.delete()
+        UserContact.query.delete()
+        Contact.query.delete()
+        UserFile.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        user = User.register('testy@test.com', 'password', 'test', 'user')
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.calls = []
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+        JOB_HANDLERS.pop('test', None)
+
+    def test_webhook(self):
+        """ the webhook only queues the response, the worker fills in the user"""
+
+        payload = typeform_payload({'field': {'ref': 'tagline'}, 'text': 'Homes that fit'})
+        resp = self.client.post('/webhooks', json=payload)
+
+        self.assertEqual(resp.status_code, 202)
+        job = Job.query.get(resp.json['job'])
+        self.assertEqual(job.status, JobStatus.queued)
+        self.assertIsNone(User.query.get(self.user_id).tagline)
+
+        work(burst=True)
+
+        self.assertEqual(Job.query.get(job.id).status, JobStatus.done)
+        self.assertEqual(User.query.get(self.user_id).tagline, 'Homes that fit')
+
+    def test_import_database_job(self):
+        """ an uploaded contact file is imported by a job of its own"""
+
+        user = User.query.get(self.user_id)
+        user.database = b'primary_first_name,primary_last_name\nbob,smith\nann,jones\n'
+        content_hash = user.find_file('database').content_hash
+        enqueue('import_database', {'user_id': self.user_id, 'content_hash': content_hash})
+
+        work(burst=True)
+
+        self.assertEqual(len(User.query.get(self.user_id).contacts), 2)
+
+    def test_import_database_resume(self):
+        """ an import that stopped partway carries on after the last row it imported"""
+
+        user = User.query.get(self.user_id)
+        user.database = b'primary_first_name,primary_last_name\nbob,smith\nann,jones\njoe,brown\n'
+        content_hash = user.find_file('database').content_hash
+        job = enqueue('import_database', {'user_id': self.user_id, 'content_hash': content_hash})
+        job.progress = 1
+        db.session.commit()
+
+        work(burst=True)
+
+        names = sorted(contact.primary_first_name for contact in User.query.get(self.user_id).contacts)
+        self.assertEqual(names, ['ann', 'joe'])
+        self.assertEqual(Job.query.get(job.id).progress, 3)
+
+    def test_webhook_repeated(self):
+        """ a delivery typeform repeats is not processed again"""
+
+        payload = typeform_payload({'field': {'ref': 'tagline'}, 'text': 'Homes that fit'})
+        payload['form_response']['token'] = 'abc123'
+
+        first = self.client.post('/webhooks', json=payload)
+        work(burst=True)
+        again = self.client.post('/webhooks', json=payload)
+
+        self.assertEqual(again.json['job'], first.json['job'])
+        self.assertEqual(Job.query.count(), 1)
+        self.assertEqual(Job.query.get(first.json['job']).status, JobStatus.done)
+
+        ## a changed response is new work
+        payload['form_response']['answers'][-1]['text'] = 'Homes for everyone'
+        changed = self.client.post('/webhooks', json=payload)
+        self.assertNotEqual(changed.json['job'], first.json['job'])
+
+    def test_failed_job_requeued(self):
+        """ queueing a failed job's key again runs it again"""
+
+        JOB_HANDLERS['test'] = lambda job: self.calls.append(job.payload)
+        job = enqueue('test', {'n': 1}, key='test:1')
+        job.status = JobStatus.failed
+        job.attempts = 3
+        db.session.commit()
+
+        self.assertEqual(enqueue('test', {'n': 1}, key='test:1').id, job.id)
+        work(burst=True)
+
+        self.assertEqual(Job.query.get(job.id).status, JobStatus.done)
+        self.assertEqual(self.calls, [{'n': 1}])
+
+    def test_retry(self):
+        """ a failing job is queued again for later, then marked failed after its last attempt"""
+
+        def handler(job):
+            self.calls.append(job.payload)
+            raise ValueError('download failed')
+
+        JOB_HANDLERS['test'] = handler
+        job_id = enqueue('test', {'n': 1}, max_attempts=2).id
+
+        work(burst=True)
+
+        job = Job.query.get(job_id)
+        self.assertEqual(job.status, JobStatus.queued)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, datetime.utcnow())
+        self.assertIn('download failed', job.last_error)
+        self.assertEqual(len(self.calls), 1)
+
+        ## not due yet
+        self.assertIsNone(claim_job())
+
+        job.run_at = datetime.utcnow()
+        db.session.commit()
+        work(burst=True)
+
+        job = Job.query.get(job_id)
+        self.assertEqual(job.status, JobStatus.failed)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(self.calls, [{'n': 1}, {'n': 1}])
+
+    def test_lost_job(self):
+        """ a job left running by a worker that died is run again"""
+
+        JOB_HANDLERS['test'] = lambda job: self.calls.append(job.payload)
+        job = enqueue('test', {'n': 1})
+
+        claim_job()
+        job.started_at = datetime(2000, 1, 1)
+        db.session.commit()
+
+        run_job(claim_job())
+
+        job = Job.query.get(job.id)
+        self.assertEqual(job.status, JobStatus.done)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(self.calls, [{'n': 1}])
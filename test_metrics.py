@@ -0,0 +1,167 @@
+"""Metrics tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_metrics.py
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///jane-test"
+
+
+# Now we can import app
+
+from app import app
+from models import db, User
+import metrics
+
+app.config['SQLALCHEMY_ECHO'] = False
+
+# /metrics needs a token outside of testing and debug mode
+app.config['TESTING'] = True
+
+# keep the totals of these tests apart from any running server's
+metrics.METRICS_DIR = tempfile.mkdtemp()
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.drop_all()
+db.create_all()
+
+
+class MetricsTestCase(TestCase):
+    """Test /metrics and the Server-Timing header."""
+
+    def setUp(self):
+        """Create test client, start the counts over."""
+
+        User.query.delete()
+        db.session.commit()
+
+        metrics.metrics.values.clear()
+        shutil.rmtree(metrics.METRICS_DIR, ignore_errors=True)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['SERVER_TIMING'] = False
+        metrics.METRICS_TOKEN = None
+
+    def test_request_metrics(self):
+        """ requests are counted by endpoint, with their time, size and queries"""
+
+        self.client.get('/login')
+        self.client.get('/login')
+        self.client.get('/nowhere')
+
+        resp = self.client.get('/metrics')
+        text = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('http_requests_total{endpoint="views.login",method="GET",status="200"} 2', text)
+        self.assertIn('http_requests_total{endpoint="none",method="GET",status="404"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{endpoint="views.login",method="GET"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="views.login",method="GET",le="+Inf"} 2', text)
+        self.assertIn('http_response_size_bytes_count{endpoint="views.login",method="GET"} 2', text)
+        self.assertIn('db_queries_per_request_count{endpoint="views.login",method="GET"} 2', text)
+
+    def test_query_count(self):
+        """ the SQL queries of a request are counted"""
+
+        user = User.register('testy@test.com', 'password', 'test', 'user')
+        db.session.add(user)
+        db.session.commit()
+
+        self.client.post('/login', data={'email': 'testy@test.com', 'password': 'password'})
+        text = self.client.get('/metrics').get_data(as_text=True)
+
+        ## looking the user up by email is at least one query
+        self.assertIn('db_queries_per_request_bucket{endpoint="views.login",method="POST",le="0"} 0', text)
+        self.assertIn('db_queries_per_request_count{endpoint="views.login",method="POST"} 1', text)
+
+    def test_other_processes(self):
+        """ /metrics adds up the totals other processes wrote"""
+
+        self.client.get('/login')
+        metrics.metrics.flush(force=True)
+        ## as if written by another running process
+        os.rename(os.path.join(metrics.METRICS_DIR, f"{os.getpid()}.json"),
+                  os.path.join(metrics.METRICS_DIR, f"{os.getppid()}.json"))
+
+        text = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertIn('http_requests_total{endpoint="views.login",method="GET",status="200"} 2', text)
+
+    def test_dead_processes(self):
+        """ the totals of processes that have exited are dropped"""
+
+        self.client.get('/login')
+        metrics.metrics.flush(force=True)
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        dead = os.path.join(metrics.METRICS_DIR, f"{process.pid}.json")
+        os.rename(os.path.join(metrics.METRICS_DIR, f"{os.getpid()}.json"), dead)
+
+        text = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertIn('http_requests_total{endpoint="views.login",method="GET",status="200"} 1', text)
+        self.assertFalse(os.path.exists(dead))
+
+    def test_query_budget(self):
+        """ a request running more queries than its view's budget is logged and counted"""
+
+        user = User.register('testy@test.com', 'password', 'test', 'user')
+        db.session.add(user)
+        db.session.commit()
+
+        login = app.view_functions['views.login']
+        budget = login.query_budget
+        login.query_budget = 0
+        try:
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                self.client.post('/login', data={'email': 'testy@test.com', 'password': 'password'})
+        finally:
+            login.query_budget = budget
+
+        self.assertIn('views.login ran 1 SQL queries, its budget is 0', logs.output[0])
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('query_budget_exceeded_total{endpoint="views.login"} 1', text)
+
+    def test_server_timing(self):
+        """ responses get a Server-Timing header only when it's turned on"""
+
+        self.assertNotIn('Server-Timing', self.client.get('/login').headers)
+
+        app.config['SERVER_TIMING'] = True
+        timing = self.client.get('/login').headers['Server-Timing']
+
+        self.assertIn('db;desc="', timing)
+        self.assertIn('app;dur=', timing)
+
+    def test_token(self):
+        """ with a token set, /metrics needs it"""
+
+        metrics.METRICS_TOKEN = 'secret'
+
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        resp = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_no_token(self):
+        """ without a token, /metrics is only served in debug and testing mode"""
+
+        app.config['TESTING'] = False
+        try:
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        finally:
+            app.config['TESTING'] = True
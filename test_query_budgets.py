@@ -0,0 +1,185 @@
+"""Query budget tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_query_budgets.py
+
+
+import os
+from unittest import TestCase
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///jane-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from models import db, User, Contact, UserContact, UserFile, Job, Tag, ContactTag, Transaction, Stage, Task
+from fake_data import add_fake_data, FAKE_PASSWORD
+from metrics import count_queries
+from usercache import user_cache
+import passwords
+
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['WTF_CSRF_ENABLED'] = False
+# serve /metrics without a token
+app.config['TESTING'] = True
+
+db.drop_all()
+db.create_all()
+
+# contacts of the user the routes are tried with, the second time more than the first
+SIZES = [20, 200]
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+
+
+def contact_form(first_name):
+    return {'primary_first_name': first_name, 'primary_last_name': 'budget', 'status': 'Buyer',
+            'mail_preference': 'All'}
+
+
+# name: (logged in, method, url, form data). Urls are formatted with the user's id, the id of one of the user's
+# contacts and the phone of that contact. The name before the colon is the endpoint of the route.
+ROUTES = {
+    'views.home': (False, 'GET', '/', None),
+    'views.signup': (False, 'GET', '/signup', None),
+    'views.signup:post': (False, 'POST', '/signup', {'email': 'new{size}@test.com', 'password': 'password',
+                                                     'first_name': 'new', 'last_name': 'user'}),
+    'views.login': (False, 'GET', '/login', None),
+    'views.login:post': (False, 'POST', '/login', {'email': 'user0@example.com', 'password': FAKE_PASSWORD}),
+    'views.login:rehash': (False, 'POST', '/login', 'rehash'),
+    'views.logout': (True, 'GET', '/logout', None),
+    'views.onboard': (True, 'GET', '/onboard', None),
+    'views.typeform_responses': (False, 'POST', '/webhooks', 'typeform'),
+    'views.home_page': (True, 'GET', '/users/{user_id}', None),
+    'views.user_settings': (True, 'GET', '/users/{user_id}/settings', None),
+    'views.user_settings:post': (True, 'POST', '/users/{user_id}/settings', {'first_name': 'user0',
+                                                                            'last_name': 'fake',
+                                                                            'tagline': 'with {size}'}),
+    'views.payment': (True, 'GET', '/payment', None),
+    'views.user_file': (True, 'GET', '/users/{user_id}/files/headshot', None),
+    'views.contacts': (True, 'GET', '/users/{user_id}/contacts', None),
+    'views.contacts:post': (True, 'POST', '/users/{user_id}/contacts', contact_form('new{size}')),
+    'views.contact_details': (True, 'GET', '/contacts/{contact_id}', None),
+    'views.contact_edit': (True, 'GET', '/contacts/{contact_id}/edit', None),
+    'views.contact_edit:post': (True, 'POST', '/contacts/{contact_id}/edit', contact_form('edited')),
+    'views.transactions': (True, 'GET', '/users/{user_id}/transactions', None),
+    'views.trans_details': (True, 'GET', '/users/{user_id}/transactions/1', None),
+    'views.list_contacts': (True, 'GET', '/api/contacts?contact_id={user_id}', None),
+    'views.list_contacts:page': (True, 'GET', '/api/contacts?contact_id={user_id}&limit=10', None),
+    'views.list_contacts:search': (True, 'GET', '/api/contacts?contact_id={user_id}&search=smith', None),
+    'views.list_contacts:search_page': (True, 'GET', '/api/contacts?contact_id={user_id}&search=smith&limit=10', None),
+    'views.list_contact_changes': (True, 'GET', '/api/contacts/changes?contact_id={user_id}', None),
+    'views.lookup_phone': (True, 'GET', '/api/lookup?phone={phone}', None),
+    'metrics': (False, 'GET', '/metrics', None),
+    ## last, it hides the contact the others use
+    'views.delete_contact': (True, 'POST', '/contacts/{contact_id}/delete', None),
+}
+
+
+class QueryBudgetTestCase(TestCase):
+    """Test that every route stays within its query budget, whatever the amount of data."""
+
+    def setUp(self):
+        self.clear()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.clear()
+
+    def clear(self):
+        for model in [Job, Task, Stage, Transaction, ContactTag, Tag, UserFile, UserContact, Contact, User]:
+            model.query.delete()
+        db.session.commit()
+
+    def run_routes(self, size):
+        """ request every route for the made up user0, with size contacts. Returns name: (number of queries,
+        the statements)"""
+
+        user = User.query.filter_by(email='user0@example.com').one()
+        contact = (Contact.query.join(UserContact, UserContact.contact_id == Contact.id)
+                   .filter(UserContact.user_id == user.id, Contact.is_visible.is_(True))
+                   .order_by(Contact.id).first())
+        password = user.password
+        params = {'user_id': user.id, 'contact_id': contact.id, 'phone': contact.primary_phone, 'size': size}
+        db.session.commit()
+
+        counts = {}
+        for name, (logged_in, method, url, data) in ROUTES.items():
+            client = app.test_client()
+            if logged_in:
+                with client.session_transaction() as session:
+                    session[CURR_USER_KEY] = user.id
+            ## every request loads the user as if it weren't cached
+            user_cache.invalidate(user.id)
+
+            url = url.format(**params)
+            if data == 'typeform':
+                kwargs = {'json': {'form_response': {'token': str(size), 'answers': [
+                    {'field': {'ref': 'first_name'}, 'text': 'user0'},
+                    {'field': {'ref': 'last_name'}, 'text': 'fake'}]}}}
+            elif data == 'rehash':
+                kwargs = {'data': {'email': 'user0@example.com', 'password': FAKE_PASSWORD}}
+            elif data:
+                kwargs = {'data': {key: value.format(**params) for (key, value) in data.items()}}
+            else:
+                kwargs = {}
+
+            ## a login with a password hashed at another cost than BCRYPT_ROUNDS, which hashes it again. The old
+            ## hash is put back after, so the other logins don't
+            rounds = passwords.BCRYPT_ROUNDS
+            if data == 'rehash':
+                passwords.BCRYPT_ROUNDS = 4 if rounds != 4 else 5
+
+            try:
+                with count_queries() as statements:
+                    resp = client.open(url, method=method, **kwargs)
+            finally:
+                passwords.BCRYPT_ROUNDS = rounds
+
+            if data == 'rehash':
+                self.assertNotEqual(db.session.query(User.password).filter_by(id=user.id).scalar(), password)
+                User.query.filter_by(id=user.id).update({User.password: password})
+                db.session.commit()
+
+            self.assertLess(resp.status_code, 400, f"{name}: {resp.status}")
+            ## a form that was turned down would skip most of the route's queries
+            if kwargs.get('data'):
+                self.assertEqual(resp.status_code, 302, name)
+            counts[name] = (len(statements), statements)
+            db.session.remove()
+
+        return counts
+
+    def test_query_budgets(self):
+        """ no route runs more queries than its budget, or more queries for a user with more contacts"""
+
+        add_fake_data(0, SIZES[0])
+        User.query.filter_by(email='user0@example.com').one().headshot = PNG
+        db.session.commit()
+        small = self.run_routes(SIZES[0])
+
+        add_fake_data(SIZES[0], SIZES[1])
+        large = self.run_routes(SIZES[1])
+
+        for name, (count, statements) in large.items():
+            endpoint = name.split(':')[0]
+            budget = app.view_functions[endpoint].query_budget
+            with self.subTest(route=name):
+                self.assertLessEqual(count, budget, '\n'.join(statements))
+                self.assertEqual(count, small[name][0], '\n'.join(statements))
+
+    def test_every_route_has_a_budget(self):
+        """ every route has a budget and is tried above"""
+
+        endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+
+        self.assertEqual(endpoints, {name.split(':')[0] for name in ROUTES})
+        for endpoint in endpoints:
+            self.assertTrue(hasattr(app.view_functions[endpoint], 'query_budget'), endpoint)
@@ -6,9 +6,12 @@
 
 
 import os
+import time
 from unittest import TestCase
 
-from models import db, User, Contact
+from models import db, User, Contact, UserFile
+import models
+import passwords
 
 from sqlalchemy.exc import IntegrityError
 
@@ -47,6 +50,7 @@ class UserModelTestCase(TestCase):
     def setUp(self):
         """Create test client, add sample data."""
 
+        UserFile.query.delete()
         User.query.delete()
 
         self.u = User(
@@ -104,6 +108,127 @@ class UserModelTestCase(TestCase):
         ## invalidate user with wrong username
         self.assertNotEqual(user1, user4)
 
+    def test_user_email_case(self):
+        """ are emails stored lower cased, so logins match them whatever the case and they stay unique?"""
+
+        user1 = User.register(' Testy@Test.com', 'password', 'testuser1', "lastname")
+        db.session.add(user1)
+        db.session.commit()
+
+        self.assertEqual(user1.email, 'testy@test.com')
+        self.assertEqual(User.authenticate('TESTY@test.com', 'password'), user1)
+
+        user2 = User.register('testy@TEST.com', 'password', 'testuser2', "lastname")
+        db.session.add(user2)
+        self.assertRaises(IntegrityError, db.session.commit)
+
+    def test_password_rehash(self):
+        """ is a password hashed with an old cost hashed again at login?"""
+
+        rounds = passwords.BCRYPT_ROUNDS
+        passwords.BCRYPT_ROUNDS = 4
+        try:
+            user = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+            db.session.add(user)
+            db.session.commit()
+            self.assertTrue(user.password.startswith('$2b$04$'))
+
+            passwords.BCRYPT_ROUNDS = 5
+            self.assertEqual(User.authenticate('testy@test.com', 'password'), user)
+            self.assertTrue(User.query.get(user.id).password.startswith('$2b$05$'))
+            self.assertEqual(User.authenticate('testy@test.com', 'password'), user)
+        finally:
+            passwords.BCRYPT_ROUNDS = rounds
+
+    def test_password_rehash_busy(self):
+        """ is a right password still let in when the pool is too busy to hash it again?"""
+
+        rounds = passwords.BCRYPT_ROUNDS
+        hash_password = passwords.hash_password
+        passwords.BCRYPT_ROUNDS = 4
+        try:
+            user = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+            db.session.add(user)
+            db.session.commit()
+
+            passwords.BCRYPT_ROUNDS = 5
+
+            def busy(password):
+                raise passwords.PasswordBusy()
+            models.hash_password = busy
+
+            self.assertEqual(User.authenticate('testy@test.com', 'password'), user)
+            self.assertTrue(User.query.get(user.id).password.startswith('$2b$04$'))
+        finally:
+            passwords.BCRYPT_ROUNDS = rounds
+            models.hash_password = hash_password
+
+    def test_unknown_email(self):
+        """ is a login with an unknown email checked against the dummy hash?"""
+
+        self.assertFalse(User.authenticate('nobody@test.com', 'password'))
+        self.assertIsNotNone(passwords.dummy_hash)
+
+    def test_password_busy(self):
+        """ are password checks turned away when too many are running?"""
+
+        user = User.register('testy@test.com', 'password', 'testuser1', "lastname")
+        db.session.add(user)
+        db.session.commit()
+
+        for _ in range(passwords.MAX_PASSWORD_JOBS):
+            passwords.slots.acquire()
+        try:
+            self.assertRaises(passwords.PasswordBusy, User.authenticate, 'testy@test.com', 'password')
+        finally:
+            for _ in range(passwords.MAX_PASSWORD_JOBS):
+                passwords.slots.release()
+
+        self.assertEqual(User.authenticate('testy@test.com', 'password'), user)
+
+    def test_password_timeout(self):
+        """ is a hash that takes too long turned away, without freeing its slot before the pool is done with it?"""
+
+        timeout = passwords.PASSWORD_TIMEOUT
+        passwords.PASSWORD_TIMEOUT = 0.01
+        try:
+            self.assertRaises(passwords.PasswordBusy, passwords.run, time.sleep, 0.5)
+
+            free = 0
+            while passwords.slots.acquire(False):
+                free += 1
+            for _ in range(free):
+                passwords.slots.release()
+            self.assertEqual(free, passwords.MAX_PASSWORD_JOBS - 1)
+        finally:
+            passwords.PASSWORD_TIMEOUT = timeout
+            time.sleep(0.5)
+
+    def test_user_files(self):
+        """ are uploaded files stored outside the users table and only loaded when used?"""
+
+        self.u.headshot = b'headshot bytes'
+        self.u.bio = b'bio bytes'
+        db.session.add(self.u)
+        db.session.commit()
+        user_id = self.u.id
+        db.session.expunge_all()
+
+        user = User.query.get(user_id)
+        files = {file.kind: file for file in user.files}
+        self.assertEqual(sorted(files), ['bio', 'headshot'])
+        self.assertNotIn('content', files['headshot'].__dict__)
+        self.assertEqual(files['headshot'].size, len(b'headshot bytes'))
+
+        self.assertEqual(user.headshot, b'headshot bytes')
+        self.assertIsNone(user.logo)
+
+        user.headshot = b'new headshot'
+        user.bio = None
+        db.session.commit()
+        self.assertEqual([file.kind for file in user.files], ['headshot'])
+        self.assertEqual(user.headshot, b'new headshot')
+
 
 
 class ContactModelTestCase(TestCase):
@@ -134,4 +259,17 @@ class ContactModelTestCase(TestCase):
         self.assertEqual(self.contact.get_contact_attribute('primary_email'), "testy@gmail.com")
         self.assertEqual(self.contact.get_contact_attribute('secondary_phone'), "666-6666")
         self.assertEqual(self.contact.get_contact_attribute('zip_code'), "34556")
+
+    def test_get_secondary_name(self):
+        """test get secondary name method"""
+        self.assertEqual(self.contact.get_secondary_name(), "None")
+        self.contact.secondary_last_name = 'smith'
+        self.assertEqual(self.contact.get_secondary_name(), "smith")
+
+    def test_serialize_rows(self):
+        """test that serializing from the selected columns gives the same result as serialize"""
+        rows = Contact.select_serialized(Contact.query).all()
+        self.assertEqual(Contact.serialize_rows(rows), [self.contact.serialize()])
+        self.assertEqual(self.contact.serialize()['secondary_email'], "None")
+        self.assertEqual(self.contact.serialize()['get_address'], "1234 mackubin St., 44, Seattle, WA 34556")
         
\ No newline at end of file
@@ -5,10 +5,16 @@
 #    FLASK_ENV=production python -m unittest test_user_views.py
 
 
+import multiprocessing
 import os
+from io import BytesIO
 from unittest import TestCase
 
-from models import db, connect_db, User
+from PIL import Image
+
+from sqlalchemy import event
+
+from models import db, connect_db, User, UserFile
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -21,6 +27,8 @@ os.environ['DATABASE_URL'] = "postgresql:///jane-test"
 # Now we can import app
 
 from app import app, CURR_USER_KEY
+from usercache import user_cache, get_current_user, UserGone
+import passwords
 
 app.config['SQLALCHEMY_ECHO'] = False
 
@@ -35,6 +43,18 @@ db.create_all()
 app.config['WTF_CSRF_ENABLED'] = False
 
 
+def login_from_worker(barrier, statuses):
+    """ log in from a forked process, like a gunicorn worker, at the same time as the others"""
+
+    barrier.wait(30)
+    resp = app.test_client().post('/login', data={'email': 'testy@test.com', 'password': 'password'})
+    statuses.put(resp.status_code)
+
+    ## a multiprocessing child waits for its own children before the pool would be told to stop
+    if passwords.pool:
+        passwords.pool.shutdown()
+
+
 class UserViewTestCase(TestCase):
     """Test views for messages."""
 
@@ -42,6 +62,7 @@ class UserViewTestCase(TestCase):
         """Create test client, add sample data."""
 
         User.query.delete()
+        user_cache.clear()
 
         self.client = app.test_client()
 
@@ -56,6 +77,79 @@ class UserViewTestCase(TestCase):
         db.session.rollback()
 
 
+    def test_login_spike(self):
+        """Test that logins past MAX_PASSWORD_JOBS in all the workers together are turned away at once with a 503"""
+
+        context = multiprocessing.get_context('fork')
+        workers = 3
+        max_jobs = passwords.MAX_PASSWORD_JOBS
+        passwords.MAX_PASSWORD_JOBS = 1
+        passwords.share_slots()
+
+        ## the workers make their own connections and pools
+        db.session.remove()
+        db.engine.dispose()
+        if passwords.pool:
+            passwords.pool.shutdown()
+            passwords.pool = None
+
+        try:
+            barrier = context.Barrier(workers)
+            statuses = context.Queue()
+            processes = [context.Process(target=login_from_worker, args=(barrier, statuses)) for _ in range(workers)]
+            for process in processes:
+                process.start()
+            results = sorted(statuses.get(timeout=30) for _ in processes)
+            for process in processes:
+                process.join(30)
+        finally:
+            passwords.MAX_PASSWORD_JOBS = max_jobs
+            passwords.share_slots()
+
+        self.assertEqual(results[0], 302)
+        self.assertEqual(results[1:], [503] * (workers - 1))
+
+    def test_deleted_user(self):
+        """Test that a user deleted while their snapshot is cached is logged out instead of getting an error"""
+
+        user = User.register('gone@test.com', 'password', 'gone', 'user')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        current = get_current_user(user_id)
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+
+        ## contacts isn't in the snapshot, so it needs the deleted row
+        self.assertRaises(UserGone, getattr, current, 'contacts')
+        self.assertIsNone(get_current_user(user_id))
+
+    def test_user_cache(self):
+        """Test that the logged in user is cached between requests and reloaded after changing settings"""
+
+        queries = []
+        def count(*args):
+            queries.append(args[2])
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.get(f"/users/{self.testuser.id}")
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                resp = c.get(f"/users/{self.testuser.id}")
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            self.assertEqual(resp.status_code, 302)
+            self.assertEqual(queries, [])
+
+            resp = c.post(f"/users/{self.testuser.id}/settings", data={'first_name': 'renamed', 'last_name': 'lastname'},
+                          follow_redirects=True)
+            self.assertIn('Renamed', resp.get_data(as_text=True))
+
     def test_users_route(self):
 
         """Test simple users route"""
@@ -71,3 +165,102 @@ class UserViewTestCase(TestCase):
 
     
 
+
+
+class UserFileViewTestCase(TestCase):
+    """Test views for uploaded files."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        UserFile.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        image = BytesIO()
+        Image.new('RGB', (1000, 500), 'red').save(image, format='PNG')
+        self.png = image.getvalue()
+
+        testuser = User.register('testy@test.com','password','testuser1', "lastname")
+        testuser.headshot = self.png
+        testuser.bio = b'0123456789' * 100
+        otheruser = User.register('other@test.com','password','otheruser', "lastname")
+        db.session.add_all([testuser, otheruser])
+        db.session.commit()
+
+        self.testuser_id = testuser.id
+        self.otheruser_id = otheruser.id
+        self.bio_hash = testuser.find_file('bio').content_hash
+
+    def tearDown(self):
+        """Clean up any fouled transaction."""
+
+        db.session.rollback()
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_file(self):
+        """Test that a whole file is sent with its hash as ETag"""
+
+        self.login(self.testuser_id)
+        resp = self.client.get(f'/users/{self.testuser_id}/files/bio')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_data(), b'0123456789' * 100)
+        self.assertEqual(resp.headers['ETag'], f'"{self.bio_hash}"')
+        self.assertIn('no-cache', resp.headers['Cache-Control'])
+
+        resp = self.client.get(f'/users/{self.testuser_id}/files/bio', headers={'If-None-Match': f'"{self.bio_hash}"'})
+        self.assertEqual(resp.status_code, 304)
+
+        resp = self.client.get(f'/users/{self.testuser_id}/files/bio?v={self.bio_hash}')
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+
+        resp = self.client.get(f'/users/{self.testuser_id}/files/logo')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_file_range(self):
+        """Test that a byte range of a file can be asked for"""
+
+        self.login(self.testuser_id)
+        resp = self.client.get(f'/users/{self.testuser_id}/files/bio', headers={'Range': 'bytes=5-14'})
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.get_data(), b'5678901234')
+        self.assertEqual(resp.headers['Content-Range'], 'bytes 5-14/1000')
+
+        resp = self.client.get(f'/users/{self.testuser_id}/files/bio', headers={'Range': 'bytes=2000-'})
+        self.assertEqual(resp.status_code, 416)
+
+    def test_file_variant(self):
+        """Test that image thumbnails are made and sent"""
+
+        self.login(self.testuser_id)
+        resp = self.client.get(f'/users/{self.testuser_id}/files/headshot?variant=thumb.webp')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'image/webp')
+        self.assertEqual(Image.open(BytesIO(resp.get_data())).size, (256, 128))
+
+        resp = self.client.get(f'/users/{self.testuser_id}/files/bio?variant=thumb')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_file_variant_broken_image(self):
+        """Test that asking for a variant of a file that only looks like an image is a 404"""
+
+        user = User.query.get(self.testuser_id)
+        user.headshot = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+        db.session.commit()
+
+        self.login(self.testuser_id)
+        resp = self.client.get(f'/users/{self.testuser_id}/files/headshot?variant=thumb')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get(f'/users/{self.testuser_id}/files/headshot')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_file_other_user(self):
+        """Test that users can't see each other's files"""
+
+        self.login(self.otheruser_id)
+        resp = self.client.get(f'/users/{self.testuser_id}/files/bio')
+        self.assertEqual(resp.status_code, 403)
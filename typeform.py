@@ -1,9 +1,42 @@
-import requests
-from models import connect_db, db, User
-import pandas as pd
-from models import Contact, Property, MailOptions
-from datetime import datetime
-from helper import get_contact_image
+import hashlib
+import json
+
+from models import connect_db, db, User, USER_FILE_KINDS
+from jobs import job_handler, enqueue, save_progress
+from metrics import timed
+
+
+@job_handler('typeform')
+def process_typeform_response(job):
+    """ job handling a typeform webhook call (see typeform_responses in app.py)"""
+
+    extract_typeform_answers(job.payload['form_response']['answers'])
+
+
+@job_handler('import_database')
+def import_database(job):
+    """ job importing the contacts of the database file a user uploaded during onboarding.
+
+    The job's progress is the last row imported, so a retry carries on after it instead of importing rows twice.
+    """
+
+    user = User.query.get(job.payload['user_id'])
+    file = user.find_file('database') if user else None
+
+    ## a newer upload has a job of its own
+    if file and file.content_hash == job.payload['content_hash']:
+        extract_database(user, file.content, start_row=job.progress,
+                         checkpoint=lambda row: save_progress(job, row))
+
+
+def delivery_key(payload):
+    """ the job key of a typeform webhook call: its response token and a hash of the answers, so a delivery that
+    typeform repeats is only processed once"""
+
+    response = payload['form_response']
+    answers = json.dumps(response['answers'], sort_keys=True).encode('utf8')
+
+    return f"typeform:{response.get('token')}:{hashlib.sha256(answers).hexdigest()}"
 
 
 def extract_typeform_answers(answers):
@@ -26,6 +59,7 @@ def extract_typeform_answers(answers):
     if user:
         print('*****************')
         print('we found this user')
+        file_urls = {}
         for answer in answers:
 
             if answer['field']['ref'] == 'designation':
@@ -73,118 +107,45 @@ def extract_typeform_answers(answers):
             if answer['field']['ref'] == 'email_acct_info':
                 text = answer['text']
                 user.email_acct_info = text
-            if answer['field']['ref'] == 'broker_logo_one':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.broker_logo_one = content
-            if answer['field']['ref'] == 'broker_logo_two':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.broker_logo_two = content
-            if answer['field']['ref'] == 'logo':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.logo = content
-            if answer['field']['ref'] == 'headshot':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.headshot = content
-            if answer['field']['ref'] == 'signature':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.signature = content
-            if answer['field']['ref'] == 'database':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.database = content
-                extract_database(user, content)
-            if answer['field']['ref'] == 'listing_docs':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.listing_docs = content
-            if answer['field']['ref'] == 'buyers_docs':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.buyers_docs = content
-            if answer['field']['ref'] == 'bio':
-                url = answer['file_url']
-                file = requests.get(url)
-                content = file.content
-                user.bio = content
+            if answer['field']['ref'] in USER_FILE_KINDS:
+                # uploaded files are fetched together once all the answers are read
+                file_urls[answer['field']['ref']] = answer['file_url']
+
+        ## requests and the importer (pandas) are slow to load, only the worker running these jobs needs them
+        from downloads import download_all
+
+        with timed('typeform_download'):
+            files = download_all(file_urls)
+        for kind, file in files.items():
+            with file:
+                user.set_file(kind, file.read())
+
+        if 'database' in files:
+            # imported by its own job once this one has committed (see import_database)
+            content_hash = user.find_file('database').content_hash
+            enqueue('import_database', {'user_id': user.id, 'content_hash': content_hash}, commit=False,
+                    key=f"import_database:{user.id}:{content_hash}")
     db.session.commit()
-    return user
-
-
-def extract_database(user, content):
-    """ extract contacts from excel file and save as individual contacts"""
-
-
-    # read bynary as a pandas object
-    df = pd.read_excel(content)
-
-    # change it to a list of dictionaries that is ready to be iterated. a dictinary for each row in the excel sheet
-    contact_dicts = df.to_dict('records')
 
-    # iterate through the list and save each dictionary (each excel row) as a contact model
-    for data in contact_dicts:
-
-        # excel cells with no content come in as nan. If it does, change it to None for the database.
-        for key, value in data.items():
-            if pd.isna(value):
-                data[key] = None
-
-        #  since The reason there are no address data points in the contact model if we want to create a contact model
-        # from the excel sheet, we must remove address-related data points from the converted dict
-        # we will use these data points create a new property model. we will use that id as a foreign key to the property model
-        # address = data.pop('address', None)
-        # suite = data.pop('suite', None)
-        # city = data.pop('city', None)
-        # state = data.pop('state', None)
-        # zip_code = data.pop('zip_code', None)
-
-        # if address and city and state and zip_code:
-
-        #     prop = Property(address=address, suite=suite,
-        #                     city=city, state=state, zip_code=zip_code)
-        #     db.session.add(prop)
-        #     db.session.commit()
-        #     property_id = prop.id
-        # else:
-        #     property_id = None
-
-        # convert Pandas Timestamp in the converted dict to datetime format
-        if data['primary_DOB']:
-            data['primary_DOB'] = data['primary_DOB'].to_pydatetime()
+    ## this runs in the job worker, whose user cache isn't the web workers'. They pick the new details up when
+    ## their snapshot expires (see USER_CACHE_TTL in usercache.py)
+    return user
 
-        if data['secondary_DOB']:
-            # Change format
-            data['secondary_DOB'] = data['secondary_DOB'].to_pydatetime()
 
-        # replace string formatted mail options with enum object to be stored in database
-        for option in MailOptions:
-            if option.value == data['mail_preference']:
-                data['mail_preference'] = option
+def extract_database(user, content, start_row=0, checkpoint=None):
+    """ extract contacts from an excel or csv file and save them as contacts of the user.
 
-        ## get random avatar picture for each contact
-        name = data['primary_first_name']
-        url= get_contact_image(name)
+    Rows are read one at a time (see spreadsheet.py) and saved a chunk at a time (see importer.py).
+    """
 
-        ### note: We could check to see if the contact exists in the database before adding a new contact.  But For now we will have duplicate contacts.  
-        contact = Contact(**data, image_url=url)
+    from importer import import_contacts
+    from spreadsheet import read_rows
 
-        # add contact and user in user/contact table.
-        user.contacts.append(contact)
-        db.session.add(contact)
-        db.session.commit()
+    with timed('typeform_import'):
+        result = import_contacts(user.id, read_rows(content), start_row=start_row, checkpoint=checkpoint)
 
-        
+    print(f"imported {result.imported} contacts for {user.email}")
+    for number, error in result.errors:
+        print(f"row {number}: {error}")
 
-        # Put safeguards for when there is bad info entered.
+    return result
@@ -0,0 +1,121 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+##############################################################################
+# Logged in user cache
+#
+# Every request needs the logged in user (see add_user_to_g in app.py), but most only look at a few fields.
+# A snapshot of those fields is kept per process for a short time, and the full User is only loaded when a route
+# uses something that isn't in the snapshot. Code that changes these fields calls user_cache.invalidate(user_id).
+#
+# The cache is per process, so invalidate only reaches the process that calls it. Changes made elsewhere, like the
+# typeform answers the job worker saves (see jobs.py), show up in the web workers once their snapshot expires,
+# at most USER_CACHE_TTL seconds later.
+
+# fields of User kept in the snapshot
+SNAPSHOT_FIELDS = ['id', 'email', 'first_name', 'last_name', 'image_url', 'is_admin', 'is_onboarded', 'has_paid']
+
+# seconds a snapshot is used for, the longest a change made by another process goes unseen
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+
+class UserCache:
+    """A small LRU cache of user snapshots (dicts of SNAPSHOT_FIELDS) that expire after ttl seconds."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, user_id, load):
+        """ returns the snapshot of a user, calling load(user_id) if it isn't cached. Nothing is cached if load returns None"""
+
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(user_id)
+                return entry[1]
+
+        snapshot = load(user_id)
+
+        if snapshot is not None:
+            with self.lock:
+                self.entries[user_id] = (now + self.ttl, snapshot)
+                self.entries.move_to_end(user_id)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+
+        return snapshot
+
+    def invalidate(self, user_id):
+        """ forget the snapshot of a user, so the next request loads it again"""
+
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache(ttl=USER_CACHE_TTL)
+
+
+def load_snapshot(user_id):
+    """ loads just the snapshot fields of a user from the database, None if there is no such user"""
+
+    from models import db, User
+
+    row = db.session.query(*[getattr(User, field) for field in SNAPSHOT_FIELDS]).filter(User.id == user_id).first()
+
+    return row._asdict() if row else None
+
+
+class UserGone(Exception):
+    """ raised when the logged in user was deleted while their snapshot was cached"""
+
+
+class CurrentUser:
+    """The logged in user for one request.
+
+    Fields in the snapshot are plain attributes. Anything else (like contacts) loads the full User the first time
+    it is used and is read from it.
+    """
+
+    def __init__(self, snapshot):
+        self.__dict__.update(snapshot)
+        self._user = None
+
+    @property
+    def user(self):
+        """ the full User, loaded the first time it's needed. Raises UserGone if there is no such user anymore"""
+
+        if self._user is None:
+            from models import User
+            self._user = User.query.get(self.id)
+
+            ## the snapshot outlived the user, the next request loads no user and so is logged out
+            if self._user is None:
+                user_cache.invalidate(self.id)
+                raise UserGone()
+
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self.user, name)
+
+    def __repr__(self):
+        return f"<CurrentUser {self.first_name} {self.last_name}>"
+
+
+def get_current_user(user_id):
+    """ returns the CurrentUser for a user id, or None if there is no such user"""
+
+    snapshot = user_cache.get(user_id, load_snapshot)
+
+    return CurrentUser(snapshot) if snapshot else None
@@ -0,0 +1,197 @@
+from datetime import datetime, date
+from functools import lru_cache
+
+import pandas as pd
+from dateutil.parser import parse as parse_date
+from wtforms import StringField, TextAreaField, BooleanField
+from wtforms.validators import ValidationError
+from wtforms.fields.html5 import DateField
+from forms import ContactForm, field_rules, format_phone
+from models import ContactStat, MailOptions
+
+##############################################################################
+# Checking imported contacts
+#
+# Imported rows get the checks of ContactForm (the rules are read off the form, see forms.field_rules), but a
+# whole chunk of rows is checked at once: the rows go into a DataFrame and each check runs on a column. Phone
+# numbers and emails go through the form's own checks, once per distinct value.
+
+CONTACT_RULES = field_rules(ContactForm)
+
+TEXT_FIELDS = [name for (name, rule) in CONTACT_RULES.items() if rule['field_class'] in (StringField, TextAreaField)]
+
+DATE_FIELDS = [name for (name, rule) in CONTACT_RULES.items() if rule['field_class'] is DateField]
+
+BOOLEAN_FIELDS = [name for (name, rule) in CONTACT_RULES.items() if rule['field_class'] is BooleanField]
+
+# how yes and no are written in spreadsheets, lower cased. A blank cell is a no, like an unchecked box
+BOOLEAN_VALUES = {'true': True, 'yes': True, 'y': True, 'x': True, '1': True,
+                  'false': False, 'no': False, 'n': False, '0': False, '': False}
+
+# select fields of the form and the enum their values stand for
+ENUM_FIELDS = {'status': ContactStat, 'mail_preference': MailOptions}
+
+
+@lru_cache(maxsize=100000)
+def cached_phone(phone):
+    """ format_phone, remembered for numbers seen before. None if the number isn't valid"""
+
+    try:
+        return format_phone(phone)
+    except ValueError:
+        return None
+
+
+class CellField:
+    """Just enough of a WTForms field to run a field validator on a spreadsheet cell"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def gettext(self, string):
+        return string
+
+
+@lru_cache(maxsize=100000)
+def cached_email(validator, email):
+    """ whether the email passes the form's Email validator, remembered for emails seen before"""
+
+    try:
+        validator(None, CellField(email))
+    except ValidationError:
+        return False
+
+    return True
+
+
+def text_value(value):
+    """ a spreadsheet cell as text. Numbers like zip codes come in as floats, 94501.0 becomes '94501'"""
+
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    return str(value)
+
+
+def date_value(value):
+    """ a spreadsheet cell as a datetime, None if it isn't a date"""
+
+    if hasattr(value, 'to_pydatetime'):
+        return value.to_pydatetime()
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, str):
+        try:
+            return parse_date(value)
+        except (ValueError, OverflowError):
+            pass
+
+    return None
+
+
+def bool_value(value):
+    """ a spreadsheet cell as True or False, None if it is neither"""
+
+    if pd.api.types.is_bool(value):
+        return bool(value)
+    if pd.api.types.is_number(value) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        return BOOLEAN_VALUES.get(value.strip().lower())
+
+    return None
+
+
+class RowErrors:
+    """The first error found for each row of a chunk"""
+
+    def __init__(self, index):
+        self.messages = pd.Series(None, index=index, dtype=object)
+
+    def add(self, failed, field, message):
+        """ record the error for the rows where the boolean Series failed is True, unless they already have one"""
+
+        failed = failed & self.messages.isna()
+        self.messages[failed] = f"{field}: {message}"
+
+    @property
+    def ok(self):
+        return self.messages.isna()
+
+
+def validate_rows(rows):
+    """ check and normalize a chunk of spreadsheet rows, given as (row number, dict) pairs.
+
+    Returns (clean, errors): clean is a list of (row number, dict of contact values) for the rows that passed,
+    errors a list of (row number, message) for the ones that didn't. Columns that aren't contact fields are dropped.
+    """
+
+    if not rows:
+        return [], []
+
+    df = pd.DataFrame.from_records([data for (number, data) in rows], index=[number for (number, data) in rows])
+    df = df[[column for column in df.columns if column in CONTACT_RULES]].astype(object)
+    errors = RowErrors(df.index)
+
+    for field in TEXT_FIELDS:
+        rule = CONTACT_RULES[field]
+        if field not in df:
+            df[field] = None
+
+        column = df[field].where(df[field].notna(), None).map(text_value, na_action='ignore').str.strip()
+        column = column.where(column.notna() & (column != ''), None)
+
+        if rule['required']:
+            errors.add(column.isna(), field, rule['messages']['required'])
+        if rule['phone']:
+            formatted = column.map(cached_phone, na_action='ignore')
+            errors.add(column.notna() & formatted.isna(), field, rule['messages']['phone'])
+            column = formatted
+        if rule['email']:
+            valid = column.map(lambda email: cached_email(rule['email'], email), na_action='ignore')
+            errors.add(column.notna() & ~valid.eq(True), field, rule['messages']['email'])
+        if rule['max_length']:
+            errors.add(column.str.len() > rule['max_length'], field, rule['messages']['max_length'])
+
+        df[field] = column
+
+    for field in DATE_FIELDS:
+        if field not in df:
+            continue
+        given = df[field].notna()
+        ## numbers would be read as timestamps, leave them to date_value (which refuses them)
+        numeric = df[field].map(lambda value: isinstance(value, (int, float)))
+        parsed = pd.to_datetime(df[field].where(~numeric, None), errors='coerce').astype(object)
+        missed = given & parsed.isna()
+        if missed.any():
+            parsed[missed] = df[field][missed].map(date_value)
+        errors.add(given & parsed.isna(), field, "Not a valid date value")
+        df[field] = parsed.where(parsed.notna(), None)
+
+    for field, enum in ENUM_FIELDS.items():
+        if field not in df:
+            continue
+        options = {option.value: option for option in enum}
+        options.update({option: option for option in enum})
+        given = df[field].notna()
+        column = df[field].map(lambda value: options.get(value.strip() if isinstance(value, str) else value),
+                               na_action='ignore')
+        errors.add(given & column.isna(), field, f"Not one of {', '.join(CONTACT_RULES[field]['choices'])}")
+        df[field] = column
+
+    for field in BOOLEAN_FIELDS:
+        if field not in df:
+            continue
+        given = df[field].notna()
+        column = df[field].map(bool_value, na_action='ignore')
+        errors.add(given & column.isna(), field, "Not a yes or no value")
+        df[field] = column
+
+    valid = df[errors.ok]
+    valid = valid.astype(object).where(valid.notna(), None)
+    clean = list(zip(valid.index, valid.to_dict('records')))
+    failed = [(number, message) for (number, message) in errors.messages.dropna().items()]
+
+    return clean, failed